@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 import yaml
@@ -45,6 +46,10 @@ class Config:
     JWT_REFRESH_TOKEN_EXPIRES = config.get("JWT_REFRESH_TOKEN_EXPIRES")
     SECRET_KEY = os.environ.get("SECRET_KEY")
     PROPAGATE_EXCEPTIONS = config.get("PROPAGATE_EXCEPTIONS")
+    # Number of processes which plan the warehouses of a portfolio in parallel.
+    PORTFOLIO_MAX_WORKERS = int(os.environ.get("PORTFOLIO_MAX_WORKERS") or os.cpu_count() or 1)
+    # Directory where the files uploaded with mode=async are kept until a worker imports them.
+    IMPORT_FILE_DIR = os.environ.get("IMPORT_FILE_DIR") or os.path.join(tempfile.gettempdir(), "wmp_imports")
 
 
 class DevConfig(Config):
@@ -61,11 +66,15 @@ class TestConfig(Config):
 
 
 class CacheConfig:
-    CACHE_TYPE = "redis"
+    # Redis backend with an in-process cache in front of it.
+    CACHE_TYPE = "main.cache.TwoTierRedisCache"
     CACHE_REDIS_HOST = os.environ.get("CACHE_REDIS_HOST") or "localhost"
     CACHE_REDIS_PORT = os.environ.get("CACHE_REDIS_PORT") or 6379
     CACHE_REDIS_DB = os.environ.get("CACHE_REDIS_DB") or 0
     CACHE_DEFAULT_TIMEOUT = config.get("CACHE_DEFAULT_TIMEOUT")
+    # Number of items and seconds an item is kept in the in-process cache of each worker.
+    CACHE_LOCAL_MAX_SIZE = int(os.environ.get("CACHE_LOCAL_MAX_SIZE") or 256)
+    CACHE_LOCAL_TIMEOUT = int(os.environ.get("CACHE_LOCAL_TIMEOUT") or 5)
 
 
 config_by_name = dict(
@@ -9,6 +9,7 @@ from main.cache import cache
 from main.db import db
 from main.exceptions import CUSTOM_EXCEPTIONS
 from main.exceptions.handlers import handle_exception
+from main.jobs import worker_command
 from main.logger import ERROR, get_handler
 from main.modules import api, jwt
 from main.utils import log_user_access
@@ -31,6 +32,7 @@ def get_app(env=None, config=None):
     jwt.init_app(app)
     cache.init_app(app, config=config_by_name["cache"])
     Migrate(app, db)
+    app.cli.add_command(worker_command)
 
     # register all custom exceptions
     for exc in CUSTOM_EXCEPTIONS:
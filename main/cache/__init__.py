@@ -1,13 +1,26 @@
+import hashlib
+import inspect
+import json
+import os
+import random
+import threading
+import time
 import urllib
 from abc import ABCMeta
+from collections import OrderedDict
+from datetime import timedelta
 
-from flask import request
+from flask import current_app, request
 from flask_caching import Cache
+from flask_caching.backends import RedisCache
 from flask_jwt_extended import get_jwt_identity
 from flask_restx import Resource
 from redis import StrictRedis
+from redis.exceptions import LockError
 
 from config import config_by_name
+from main.logger import INFO, get_logger
+from main.utils import is_msgpack_accepted
 
 cache = Cache()
 
@@ -16,34 +29,355 @@ redis_config = config_by_name["cache"]
 redis_client = StrictRedis(
     redis_config["CACHE_REDIS_HOST"], redis_config["CACHE_REDIS_PORT"], charset="utf-8", decode_responses=True
 )
+cache_logger = get_logger("cache", INFO)
 
+# Channel on which the keys to remove from the in-process caches of all the workers are published.
+INVALIDATION_CHANNEL = "cache_invalidation"
+# Seconds a cached response is fresh, and then the seconds it is still served while one worker recomputes it.
+CACHE_TIMEOUT = 60
+CACHE_STALE_TIMEOUT = 60
+# Fraction of CACHE_TIMEOUT added at random to the timeout of a response, so the responses cached at the same
+# time do not expire at the same time.
+CACHE_TIMEOUT_JITTER = 0.1
+# Seconds a worker has to compute a response, which the other workers wait for when no stale response is cached.
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_POLL_INTERVAL = 0.05
 
-def cache_key() -> str:
+
+class LocalCache:
+    """
+    In-process cache of at most max_size items, which evicts the least recently used item when it is full, and
+    where an item expires timeout seconds after it is set.
+    """
+
+    def __init__(self, max_size: int, timeout: int):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        Get the value of key, or None if it is not cached or it is expired.
+        :param key:
+        :return:
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, timeout: float = None):
+        """
+        Set the value of key, which expires after timeout seconds if it is shorter than the timeout of the cache.
+        :param key:
+        :param value:
+        :param timeout:
+        :return:
+        """
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + timeout)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+local_cache = LocalCache(redis_config["CACHE_LOCAL_MAX_SIZE"], redis_config["CACHE_LOCAL_TIMEOUT"])
+invalidation_listener = None
+invalidation_listener_lock = threading.Lock()
+
+
+def handle_invalidation(message: dict):
+    keys = json.loads(message["data"])
+    if keys == "*":
+        local_cache.clear()
+    else:
+        local_cache.delete(*keys)
+
+
+def stop_invalidation_listener(error: Exception, pubsub, thread):
+    cache_logger.exception(f"Invalidation listener stopped: {error}")
+    thread.stop()
+
+
+def listen_to_invalidations():
+    """
+    This function is used to start the thread of the process which removes the keys published on the invalidation
+    channel from its local cache, unless it is running. The local cache is cleared when the thread is started, as
+    the keys published while it was not running are missed.
+    :return:
+    """
+    global invalidation_listener
+    listener = invalidation_listener
+    # The thread of a parent process does not run in its forked workers.
+    if listener is not None and listener.is_alive() and listener.pid == os.getpid():
+        return
+    with invalidation_listener_lock:
+        if invalidation_listener is not listener:
+            return
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: handle_invalidation})
+        listener = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=stop_invalidation_listener)
+        listener.pid = os.getpid()
+        local_cache.clear()
+        invalidation_listener = listener
+
+
+def publish_invalidation(keys):
+    """
+    This function is used to remove keys, or all the keys with "*", from the local caches of all the workers.
+    :param keys:
+    :return:
+    """
+    redis_client.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+
+
+class TwoTierRedisCache(RedisCache):
+    """
+    Redis backend of Flask-Caching which keeps the values it reads and writes in the local cache of the process, so
+    a hot value is read from memory. The values are kept serialized, so every read gets its own copy of the value.
+    The cache keys embed the versions of their tags, so a value of a key never changes and only a delete or a
+    clear has to be published to the other workers.
+    """
+
+    def get(self, key: str):
+        listen_to_invalidations()
+        key = self.key_prefix + key
+        dump = local_cache.get(key)
+        if dump is None:
+            dump = self._read_client.get(key)
+            if dump is None:
+                return None
+            local_cache.set(key, dump)
+        return self.serializer.loads(dump)
+
+    def set(self, key: str, value, timeout: int = None):
+        # The listener clears the local cache when it starts, so it is started before the value is kept in it.
+        listen_to_invalidations()
+        timeout = self._normalize_timeout(timeout)
+        key = self.key_prefix + key
+        dump = self.serializer.dumps(value)
+        if timeout == -1:
+            result = self._write_client.set(name=key, value=dump)
+        else:
+            result = self._write_client.setex(name=key, value=dump, time=timeout)
+        # The default timeout of the configuration is a timedelta.
+        if isinstance(timeout, timedelta):
+            timeout = timeout.total_seconds()
+        local_cache.set(key, dump, None if timeout == -1 else timeout)
+        return result
+
+    def delete(self, key: str) -> bool:
+        return bool(self.delete_many(key))
+
+    def delete_many(self, *keys: str) -> list:
+        listen_to_invalidations()
+        deleted_keys = super().delete_many(*keys)
+        if keys:
+            keys = [self.key_prefix + key for key in keys]
+            local_cache.delete(*keys)
+            publish_invalidation(keys)
+        return deleted_keys
+
+    def reload(self, key: str):
+        """
+        Get the value of key from Redis, in place of the one in the local cache.
+        :param key:
+        :return:
+        """
+        local_cache.delete(self.key_prefix + key)
+        return self.get(key)
+
+    def clear(self) -> bool:
+        result = super().clear()
+        local_cache.clear()
+        publish_invalidation("*")
+        return result
+
+
+def get_tag_version_key(tag: str) -> str:
+    return f"cache_tag_version:{tag}"
+
+
+def get_tag_versions(tags: list) -> list:
+    """
+    This function is used to get the versions of tags from the local cache, and the ones which are not in it from
+    Redis with one MGET.
+    :param tags:
+    :return:
+    """
+    listen_to_invalidations()
+    keys = [get_tag_version_key(tag) for tag in tags]
+    versions = [local_cache.get(key) for key in keys]
+    missing_keys = [key for key, version in zip(keys, versions) if version is None]
+    if missing_keys:
+        missing_versions = dict(zip(missing_keys, redis_client.mget(missing_keys)))
+        for key, version in missing_versions.items():
+            local_cache.set(key, version or "0")
+        versions = [version or missing_versions[key] or "0" for key, version in zip(keys, versions)]
+    return versions
+
+
+def get_request_key(by_user_role: bool = True) -> str:
     """
-    This function is used to create a cache key according to path, logged-in user, and request params.
+    This function is used to create a key of the request according to path, logged-in user, request params, and the
+    accepted format.
+    :param by_user_role:
     :return: str
     """
     args = request.args
     path = request.path + "?"
-    if "Authorization" in request.headers:
+    if by_user_role and "Authorization" in request.headers:
         path += f"user_role={get_jwt_identity()['role']}&"
+    if is_msgpack_accepted():
+        path += "accept=msgpack&"
     key = path + urllib.parse.urlencode([(k, v) for k in sorted(args) for v in sorted(args.getlist(k))])
     return key
 
 
-def clear_cache():
+def cache_key(tags: list, by_user_role: bool = True) -> str:
+    """
+    This function is used to create a cache key according to the versions of tags and the request. Clearing a tag
+    increments its version, so the keys made before are not used anymore and expire with their timeout.
+    :param tags:
+    :param by_user_role:
+    :return: str
+    """
+    versions = get_tag_versions(tags)
+    tag_versions = ",".join(f"{tag}@{version}" for tag, version in zip(tags, versions))
+    return f"{tag_versions}|{get_request_key(by_user_role)}"
+
+
+def get_etag(version: str, by_user_role: bool = True) -> str:
+    """
+    This function is used to create the ETag of the response to the request for data at version, which differs for
+    each path, request params and accepted format.
+    :param version:
+    :param by_user_role:
+    :return:
+    """
+    return hashlib.sha1(f"{version}|{get_request_key(by_user_role)}".encode()).hexdigest()
+
+
+def clear_cache(*tags: str):
+    """
+    This function is used to clear the cached responses of tags, by default of the path of the request, with one
+    increment of the version of each tag in a single round-trip. The versions are removed from the local caches
+    of the other workers with a message on the invalidation channel.
+    :param tags:
+    :return:
+    """
+    keys = [get_tag_version_key(tag) for tag in tags or [request.path]]
+    pipeline = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.incr(key)
+    pipeline.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+    versions = pipeline.execute()
+    for key, version in zip(keys, versions):
+        local_cache.set(key, str(version))
+
+
+def get_view_arguments(func, *args, **kwargs) -> dict:
+    """
+    This function is used to get the arguments of a view function by name, whether they are passed by position or
+    by keyword.
+    :param func:
+    :param args:
+    :param kwargs:
+    :return:
+    """
+    arguments = inspect.signature(func).bind(*args, **kwargs).arguments
+    arguments.pop("self", None)
+    return arguments
+
+
+def set_cached_response(key: str, response):
     """
-    This function is used to remove all caching keys of a particular path.
+    This function is used to cache a response, which is fresh for CACHE_TIMEOUT seconds plus a random jitter, and
+    then kept CACHE_STALE_TIMEOUT more seconds as a stale response.
+    :param key:
+    :param response:
     :return:
     """
-    key_pattern = "flask_cache_" + request.path + "*"
-    for key in redis_client.scan_iter(match=key_pattern):
-        redis_client.delete(key)
+    timeout = round(CACHE_TIMEOUT * (1 + random.uniform(0, CACHE_TIMEOUT_JITTER)))
+    cache.set(key, {"response": response, "fresh_until": time.time() + timeout}, timeout=timeout + CACHE_STALE_TIMEOUT)
+    return response
+
+
+def get_cached_response(key: str, compute):
+    """
+    This function is used to get the response of key from the cache, or to compute it and cache it. A response is
+    computed by one worker at a time, which holds a lock in Redis: meanwhile the other workers serve the stale
+    response if there is one, else they wait for the response of the worker which holds the lock.
+    :param key:
+    :param compute: function which computes the response.
+    :return:
+    """
+    entry = cache.get(key)
+    if entry is not None and entry["fresh_until"] <= time.time():
+        # The local cache may still have the stale response which another worker has recomputed.
+        entry = cache.cache.reload(key)
+    if entry is not None and entry["fresh_until"] > time.time():
+        return entry["response"]
+
+    lock = redis_client.lock(f"cache_lock:{key}", timeout=CACHE_LOCK_TIMEOUT)
+    if lock.acquire(blocking=False):
+        try:
+            return set_cached_response(key, compute())
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                cache_logger.warning(f"Lock of {key} expired before its response was computed.")
+    if entry is not None:
+        return entry["response"]
+
+    deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+    while True:
+        time.sleep(CACHE_LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["response"]
+        # The worker which held the lock failed, or took too long.
+        if not lock.locked() or time.monotonic() > deadline:
+            return compute()
 
 
 def cache_decorator(func):
     def wrapper(self, *args, **kwargs):
-        return cache.cached(key_prefix=cache_key, timeout=60)(func)(self, *args, **kwargs)
+        view_arguments = get_view_arguments(func, self, *args, **kwargs)
+        # A client which has the current version of the data gets a 304 before the response is read or computed.
+        version = self.get_data_version(**view_arguments)
+        etag = None if version is None else get_etag(version, self.cache_by_user_role)
+        if etag is not None and etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        def compute():
+            response = func(self, *args, **kwargs)
+            if etag is not None and response.status_code == 200:
+                response.set_etag(etag)
+            return response
+
+        tags = self.get_cache_tags(**view_arguments)
+        return get_cached_response(cache_key(tags, self.cache_by_user_role), compute)
 
     return wrapper
 
@@ -51,7 +385,7 @@ def cache_decorator(func):
 def clear_cache_decorator(func):
     def wrapper(self, *args, **kwargs):
         result = func(self, *args, **kwargs)
-        clear_cache()
+        clear_cache(*self.get_cache_tags(**get_view_arguments(func, self, *args, **kwargs)), *self.cache_clear_tags)
         return result
 
     return wrapper
@@ -71,4 +405,22 @@ class CacheResourceMeta(ABCMeta):
 
 
 class CacheResource(Resource, metaclass=CacheResourceMeta):
-    pass
+    # Tags of the cached responses of the resource, formatted with the view arguments. The writes of the resource
+    # clear its tags, and other writes clear them with clear_cache(*tags). By default the tag is the request path.
+    cache_tags = ()
+    # Tags which the writes of the resource clear besides its own, e.g. of a list which includes the resource.
+    cache_clear_tags = ()
+    # Whether the response depends on the role of the logged-in user.
+    cache_by_user_role = True
+
+    def get_cache_tags(self, **kwargs) -> list:
+        return [tag.format(**kwargs) for tag in self.cache_tags] or [request.path]
+
+    def get_data_version(self, **kwargs) -> str or None:
+        """
+        Version of the data of the response, which changes whenever the data changes. When it is given, the response
+        has an ETag made from it, and a request with the ETag in If-None-Match gets a 304.
+        :param kwargs: view arguments.
+        :return:
+        """
+        return None
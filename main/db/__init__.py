@@ -1,4 +1,9 @@
+from collections import defaultdict
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, insert, tuple_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
 
 db = SQLAlchemy()
 
@@ -6,6 +11,9 @@ db = SQLAlchemy()
 class BaseModel(db.Model):
     __abstract__ = True
 
+    # Number of rows written by one statement of create_many, update_many and upsert_many.
+    BATCH_CHUNK_SIZE = 1000
+
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, default=None, onupdate=db.func.now())
@@ -43,6 +51,176 @@ class BaseModel(db.Model):
         db.session.query(cls).filter_by(**filters).delete()
         db.session.commit()
 
+    @classmethod
+    def create_many(cls, rows: list, key_columns: list = None, chunk_size: int = None) -> tuple[list, list]:
+        """
+        This function is used to create many records with one insert statement per chunk of rows and a single
+        commit. The ids of the new records are looked up by key_columns, which must be unique.
+        :param rows:
+        :param key_columns:
+        :param chunk_size:
+        :return: the rows which were written with their id, and the rows in error with the error.
+        """
+        return cls.write_many(cls.insert_rows, rows, key_columns, chunk_size)
+
+    @classmethod
+    def update_many(cls, rows: list, chunk_size: int = None, commit: bool = True) -> tuple[list, list]:
+        """
+        This function is used to update many records, given as rows with their id and the columns to update, with
+        one update statement per chunk of rows and a single commit.
+        :param rows:
+        :param chunk_size:
+        :param commit: False to leave the transaction open, e.g. to roll it back when some rows are in error.
+        :return: the rows which were written, and the rows in error with the error.
+        """
+        return cls.write_many(cls.update_rows, rows, chunk_size=chunk_size, commit=commit)
+
+    @classmethod
+    def upsert_many(
+        cls, rows: list, key_columns: list, update_columns: list, chunk_size: int = None, commit: bool = True
+    ) -> tuple[list, list]:
+        """
+        This function is used to create many records, or to update the update_columns of the ones which already
+        exist with the same key_columns, with one upsert statement per chunk of rows and a single commit.
+        :param rows:
+        :param key_columns: columns of a unique constraint.
+        :param update_columns:
+        :param chunk_size:
+        :param commit: False to leave the transaction open, e.g. to write many batches in one transaction.
+        :return: the rows which were written with their id, and the rows in error with the error.
+        """
+        return cls.write_many(
+            lambda chunk: cls.upsert_rows(chunk, key_columns, update_columns), rows, key_columns, chunk_size, commit
+        )
+
+    @classmethod
+    def write_many(
+        cls, write, rows: list, key_columns: list = None, chunk_size: int = None, commit: bool = True
+    ) -> tuple[list, list]:
+        """
+        This function is used to write rows in chunks with the given write function, each chunk in a savepoint of
+        a single transaction. When a chunk fails, its rows are written one by one to find the rows in error.
+        :param write:
+        :param rows:
+        :param key_columns:
+        :param chunk_size:
+        :param commit:
+        :return:
+        """
+        chunk_size = chunk_size or cls.BATCH_CHUNK_SIZE
+        written_rows, error_data = [], []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+            try:
+                with db.session.begin_nested():
+                    write(chunk)
+            except SQLAlchemyError:
+                chunk = cls.write_one_by_one(write, chunk, error_data)
+
+            if key_columns:
+                ids = cls.get_ids(chunk, key_columns)
+                for row in chunk:
+                    row["id"] = ids.get(cls.get_key(row, key_columns))
+            written_rows.extend(chunk)
+        if commit:
+            db.session.commit()
+        return written_rows, error_data
+
+    @staticmethod
+    def write_one_by_one(write, rows: list, error_data: list) -> list:
+        """
+        This function is used to write rows one by one, each in its own savepoint. The rows which fail are added
+        to error_data with the error.
+        :param write:
+        :param rows:
+        :param error_data:
+        :return: the rows which were written.
+        """
+        written_rows = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    write([row])
+            except SQLAlchemyError as e:
+                row["error"] = str(e)
+                error_data.append(row)
+                continue
+            written_rows.append(row)
+        return written_rows
+
+    @classmethod
+    def get_values(cls, rows: list) -> list[dict]:
+        """
+        This function is used to keep only the table columns of rows, every row gets the columns of all the rows.
+        :param rows:
+        :return:
+        """
+        keys = set().union(*rows)
+        columns = [column.name for column in cls.__table__.columns if column.name in keys]
+        return [{column: row.get(column) for column in columns} for row in rows]
+
+    @classmethod
+    def insert_rows(cls, rows: list):
+        db.session.execute(insert(cls.__table__), cls.get_values(rows))
+
+    @classmethod
+    def update_rows(cls, rows: list):
+        table = cls.__table__
+        column_names = {column.name for column in table.columns} - {"id"}
+        # Every row of an executemany sets the same columns, so the rows are grouped by the columns they update.
+        rows_by_columns = defaultdict(list)
+        for row in rows:
+            values = {key: value for key, value in row.items() if key in column_names}
+            rows_by_columns[tuple(sorted(values))].append({"row_id": row["id"], **values})
+        for columns, values in rows_by_columns.items():
+            if columns:
+                db.session.execute(table.update().where(table.c.id == bindparam("row_id")), values)
+
+    @classmethod
+    def upsert_rows(cls, rows: list, key_columns: list, update_columns: list):
+        statement = cls.get_upsert_statement(db.session.get_bind().dialect.name, key_columns, update_columns)
+        db.session.execute(statement, cls.get_values(rows))
+
+    @classmethod
+    def get_upsert_statement(cls, dialect: str, key_columns: list, update_columns: list):
+        """
+        This function is used to build the insert statement of the dialect which updates the update_columns and
+        updated_at of the rows which already exist with the same key_columns.
+        :param dialect:
+        :param key_columns:
+        :param update_columns:
+        :return:
+        """
+        if dialect == "mysql":
+            statement = mysql.insert(cls.__table__)
+            return statement.on_duplicate_key_update(
+                {**{column: statement.inserted[column] for column in update_columns}, "updated_at": db.func.now()}
+            )
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(cls.__table__)
+        return statement.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={**{column: statement.excluded[column] for column in update_columns}, "updated_at": db.func.now()},
+        )
+
+    @staticmethod
+    def get_key(row: dict, key_columns: list) -> tuple:
+        return tuple(str(row.get(column)) for column in key_columns)
+
+    @classmethod
+    def get_ids(cls, rows: list, key_columns: list) -> dict:
+        """
+        This function is used to get the ids of the records of rows, keyed by the values of key_columns.
+        :param rows:
+        :param key_columns:
+        :return:
+        """
+        if not rows:
+            return {}
+        columns = [getattr(cls, column) for column in key_columns]
+        keys = {tuple(row.get(column) for column in key_columns) for row in rows}
+        records = db.session.query(cls.id, *columns).filter(tuple_(*columns).in_(keys))
+        return {cls.get_key(record._asdict(), key_columns): record.id for record in records}
+
     def serialize(self) -> dict:
         """
         This function is used to convert the model object to a dict.
@@ -0,0 +1,137 @@
+import json
+import uuid
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from main.cache import redis_client
+from main.db import db
+from main.logger import INFO, get_logger
+
+JOB_QUEUE_KEY = "jobs:queue"
+JOB_KEY_PREFIX = "jobs:"
+JOB_TTL = 24 * 60 * 60  # Seconds for which the status and the result of a job are kept.
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+
+jobs_logger = get_logger("jobs", INFO)
+
+# A mapping of job kind to the function which runs it. Register handlers with `register_job_handler`.
+JOB_HANDLERS = {}
+
+
+def register_job_handler(kind: str, handler):
+    """
+    This function is used to register the function which runs the jobs of a kind. The handler is called with
+    the job id and the job payload (a dict) and its return value is stored as the job result.
+    :param kind:
+    :param handler:
+    :return:
+    """
+    JOB_HANDLERS[kind] = handler
+
+
+def get_job_key(job_id: str) -> str:
+    return JOB_KEY_PREFIX + job_id
+
+
+def enqueue_job(kind: str, payload: dict) -> str:
+    """
+    This function is used to store a new job and push it to the queue of the workers.
+    :param kind:
+    :param payload:
+    :return: job id
+    """
+    job_id = uuid.uuid4().hex
+    key = get_job_key(job_id)
+    pipeline = redis_client.pipeline()
+    pipeline.hset(
+        key,
+        mapping={"kind": kind, "status": QUEUED, "payload": json.dumps(payload), "created_at": str(datetime.now())},
+    )
+    pipeline.expire(key, JOB_TTL)
+    pipeline.rpush(JOB_QUEUE_KEY, job_id)
+    pipeline.execute()
+    return job_id
+
+
+def update_job(job_id: str, **fields):
+    """
+    This function is used to update the fields of a job, e.g. its status or progress.
+    :param job_id:
+    :param fields:
+    :return:
+    """
+    redis_client.hset(get_job_key(job_id), mapping=fields)
+
+
+def get_job(job_id: str) -> dict or None:
+    """
+    This function is used to get the status of a job and its result once it is finished.
+    :param job_id:
+    :return:
+    """
+    job = redis_client.hgetall(get_job_key(job_id))
+    if not job:
+        return None
+    job.pop("payload", None)
+    if "result" in job:
+        job["result"] = current_app.json.loads(job["result"])
+    job["job_id"] = job_id
+    return job
+
+
+def run_job(job_id: str):
+    """
+    This function is used to run a job with its registered handler and to store its result or error.
+    :param job_id:
+    :return:
+    """
+    job = redis_client.hgetall(get_job_key(job_id))
+    if not job:
+        return
+    update_job(job_id, status=RUNNING, started_at=str(datetime.now()))
+    try:
+        result = JOB_HANDLERS[job["kind"]](job_id, json.loads(job["payload"]))
+    except Exception as e:
+        db.session.rollback()
+        jobs_logger.exception(f"Job {job_id} ({job['kind']}) failed: {e}")
+        update_job(job_id, status=FAILED, error=str(e), finished_at=str(datetime.now()))
+    else:
+        update_job(job_id, status=FINISHED, result=current_app.json.dumps(result), finished_at=str(datetime.now()))
+    finally:
+        db.session.remove()
+
+
+def run_next_job(timeout: int = 0) -> str or None:
+    """
+    This function is used to pop the next job from the queue and run it. It waits up to `timeout` seconds for a
+    job (0 means do not wait).
+    :param timeout:
+    :return: id of the job which was run.
+    """
+    if timeout:
+        item = redis_client.blpop(JOB_QUEUE_KEY, timeout=timeout)
+        job_id = item[1] if item else None
+    else:
+        job_id = redis_client.lpop(JOB_QUEUE_KEY)
+    if job_id:
+        run_job(job_id)
+    return job_id
+
+
+@click.command("worker")
+@click.option("--timeout", default=5, help="Seconds to wait for a job before polling again.")
+@with_appcontext
+def worker_command(timeout: int):
+    """
+    Run a worker which pulls jobs from the Redis queue and runs them.
+    """
+    jobs_logger.info("Worker started.")
+    while True:
+        run_next_job(timeout)
@@ -7,6 +7,10 @@ class UserController:
     UserController is used to handle all operations related to user.
     """
 
+    # Cache tags of the profile of a user, formatted with its id, and of the list of profiles.
+    PROFILE_CACHE_TAG = "user:{user_id}"
+    PROFILES_CACHE_TAG = "users"
+
     @classmethod
     def get_profile(cls, user_id: int = None) -> dict:
         """
@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required
 from flask_restx import Namespace
 
 from main.cache import CacheResource
+from main.modules.jwt.controller import JWTController
 from main.modules.user.controller import UserController
 from main.modules.user.schema_validator import UpdateProfile
 from main.utils import get_data_from_request_or_raise_validation_error
@@ -12,6 +13,10 @@ auth_router = Blueprint("auth", __name__)
 
 class Profile(CacheResource):
     method_decorators = [jwt_required()]
+    cache_clear_tags = (UserController.PROFILES_CACHE_TAG,)
+
+    def get_cache_tags(self, **kwargs) -> list:
+        return [UserController.PROFILE_CACHE_TAG.format(user_id=JWTController.get_user_identity()["user_id"])]
 
     def get(self):
         """
@@ -32,6 +37,7 @@ class Profile(CacheResource):
 
 class Profiles(CacheResource):
     method_decorators = [jwt_required()]
+    cache_tags = (UserController.PROFILES_CACHE_TAG,)
 
     def get(self):
         """
@@ -43,6 +49,8 @@ class Profiles(CacheResource):
 
 class Profiles2(CacheResource):
     method_decorators = [jwt_required()]
+    cache_tags = (UserController.PROFILE_CACHE_TAG,)
+    cache_clear_tags = (UserController.PROFILES_CACHE_TAG,)
 
     def get(self, user_id: int):
         """
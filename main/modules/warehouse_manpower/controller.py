@@ -1,16 +1,62 @@
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from random import randint, random
+from itertools import repeat
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import xlsxwriter
+from flask import current_app
+from sqlalchemy import func, null, select, union_all
 from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
 
+from main.cache import clear_cache
+from main.exceptions import CustomValidationError, RecordNotFoundError
+from main.jobs import enqueue_job, get_job, register_job_handler, update_job
 from main.modules.warehouse_manpower.model import (
     BenchmarkProductivity,
+    CalculationResult,
     Category,
+    DemandFileUpload,
     InputDemand,
     InputRequirements,
     Warehouse,
     db,
 )
+from main.modules.warehouse_manpower.schema_validator import RequirementValidator
+from main.modules.warehouse_manpower.solver import (
+    RISK_PERCENTILES,
+    PlanGrid,
+    build_plan_grid,
+    dump_state,
+    get_fulfillment_bands,
+    load_state,
+    safe_divide,
+    simulate_attendance,
+    solve_dates,
+    solve_headcount,
+    solve_scenarios,
+)
+from main.utils import (
+    get_columnar_grid,
+    get_date,
+    get_file_hash,
+    iter_keyset_pages,
+    iter_record_batches,
+    read_file,
+    read_file_in_chunks,
+)
 
 
 class WarehouseController:
@@ -18,6 +64,11 @@ class WarehouseController:
     This is the controller class which is used to handle all the logical and CURD operations of warehouse.
     """
 
+    # Cache tags of the wmp resources, the ones of a warehouse are formatted with its id.
+    WAREHOUSES_CACHE_TAG = "wmp:warehouses"
+    DEMANDS_CACHE_TAG = "wmp:warehouse:{warehouse_id}:demands"
+    PRODUCTIVITY_CACHE_TAG = "wmp:warehouse:{warehouse_id}:benchmark_productivity"
+
     @classmethod
     def add_warehouses(cls, warehouses_data: list) -> (list, list):
         """
@@ -25,19 +76,7 @@ class WarehouseController:
         :param warehouses_data:
         :return:
         """
-        new_warehouses_with_ids = []
-        error_data = []
-        for warehouse in warehouses_data:
-            try:
-                new_warehouse = Warehouse.create(warehouse)
-            except Exception as e:
-                warehouse["error"] = str(e)
-                error_data.append(warehouse)
-                Warehouse.rollback()
-                continue
-            warehouse.update({"id": new_warehouse.id})
-            new_warehouses_with_ids.append(warehouse)
-        return new_warehouses_with_ids, error_data
+        return Warehouse.create_many(warehouses_data, key_columns=["name"])
 
     @classmethod
     def get_warehouses(cls) -> list:
@@ -57,6 +96,42 @@ class WarehouseController:
         """
         return Warehouse.query.filter_by(id=warehouse_id).first()
 
+    @classmethod
+    def get_data_version(cls, warehouse_id: int, column_name: str) -> str or None:
+        """
+        Get the demand_version or productivity_version of a warehouse with the version of the categories, as their
+        names are in the demands and the benchmark productivity.
+        :param warehouse_id:
+        :param column_name:
+        :return: None if the warehouse does not exist.
+        """
+        version = db.session.query(getattr(Warehouse, column_name)).filter(Warehouse.id == warehouse_id).scalar()
+        return None if version is None else f"{version}.{Category.get_version()}"
+
+    @classmethod
+    def increment_data_version(cls, warehouse_ids: set, column_name: str):
+        """
+        Increment the demand_version or productivity_version of warehouses, which invalidates the fingerprints of
+        their stored calculation results. The results are kept on a demand change, as the last solved state of
+        their requirement, and deleted on a productivity change. Only the cached demands or benchmark productivity
+        of the warehouses are cleared.
+        :param warehouse_ids:
+        :param column_name:
+        :return:
+        """
+        if not warehouse_ids:
+            return
+        column = getattr(Warehouse, column_name)
+        Warehouse.query.filter(Warehouse.id.in_(warehouse_ids)).update({column: column + 1}, synchronize_session=False)
+        if column_name == "productivity_version":
+            CalculationResult.query.filter(CalculationResult.warehouse_id.in_(warehouse_ids)).delete(
+                synchronize_session=False
+            )
+        db.session.commit()
+
+        tag = cls.DEMANDS_CACHE_TAG if column_name == "demand_version" else cls.PRODUCTIVITY_CACHE_TAG
+        clear_cache(*[tag.format(warehouse_id=warehouse_id) for warehouse_id in warehouse_ids])
+
 
 class CategoryController:
     @classmethod
@@ -66,19 +141,7 @@ class CategoryController:
         :param category_data:
         :return:
         """
-        new_category_with_ids = []
-        error_data = []
-        for category in categories_data:
-            try:
-                new_category = Category.create(category)
-            except Exception as e:
-                category["error"] = str(e)
-                error_data.append(category)
-                Category.rollback()
-                continue
-            category.update({"id": new_category.id})
-            new_category_with_ids.append(category)
-        return new_category_with_ids, error_data
+        return Category.create_many(categories_data, key_columns=["name"])
 
     @classmethod
     def get_categories(cls) -> list:
@@ -132,51 +195,64 @@ class CategoryController:
         :param categories:
         :return:
         """
-        return [
-            category_name for category_name in categories if category_name not in Category.category_name_to_id_mapping()
-        ]
+        category_name_to_id_mapping = Category.category_name_to_id_mapping()
+        return [category_name for category_name in categories if category_name not in category_name_to_id_mapping]
 
 
 class BenchmarkProductivityController:
+    EXPORT_SCHEMA = pa.schema(
+        [
+            ("category_id", pa.int64()),
+            ("category", pa.string()),
+            ("productivity_experienced_employee", pa.float64()),
+            ("productivity_new_employee", pa.float64()),
+        ]
+    )
+
     @classmethod
     def add_benchmark_productivity(cls, benchmark_productivity: list) -> (list, list):
         """
-        Function to add benchmark productivity.
+        Function to add benchmark productivity, the productivity of the categories which already have one in the
+        warehouse is updated.
         :param benchmark_productivity:
         :return:
         """
-        new_productivity_with_ids = []
-        error_data = []
-        for productivity in benchmark_productivity:
-            try:
-                _productivity = BenchmarkProductivity.create(productivity)
-            except IntegrityError:
-                BenchmarkProductivity.rollback()
-                _productivity = BenchmarkProductivity.query.filter_by(
-                    category_id=productivity["category_id"], warehouse_id=int(productivity["warehouse_id"])
-                ).first()
-                _productivity.update(productivity)
-            except Exception as e:
-                productivity["error"] = str(e)
-                error_data.append(productivity)
-                continue
-            productivity.update({"id": _productivity.id})
-            new_productivity_with_ids.append(productivity)
+        new_productivity_with_ids, error_data = BenchmarkProductivity.upsert_many(
+            benchmark_productivity,
+            key_columns=["warehouse_id", "category_id"],
+            update_columns=["productivity_experienced_employee", "productivity_new_employee"],
+        )
+        WarehouseController.increment_data_version(
+            {int(productivity["warehouse_id"]) for productivity in new_productivity_with_ids}, "productivity_version"
+        )
         return new_productivity_with_ids, error_data
 
     @classmethod
     def update_benchmark_productivity(cls, list_of_updated_productivity: list):
         """
-        Update benchmark productivity from the list of updated benchmark productivity.
+        Update benchmark productivity from the list of updated benchmark productivity. Nothing is updated when any
+        of them can not be written.
         :param list_of_updated_productivity:
         :return:
         """
-        for new_benchmark_productivity in list_of_updated_productivity:
-            old_benchmark_productivity = BenchmarkProductivity.query.filter_by(
-                id=new_benchmark_productivity["id"]
-            ).first()
-            if old_benchmark_productivity:
-                old_benchmark_productivity.update(new_benchmark_productivity)
+        warehouse_id_by_id = dict(
+            db.session.query(BenchmarkProductivity.id, BenchmarkProductivity.warehouse_id).filter(
+                BenchmarkProductivity.id.in_([productivity["id"] for productivity in list_of_updated_productivity])
+            )
+        )
+        updated_productivity, error_data = BenchmarkProductivity.update_many(
+            [productivity for productivity in list_of_updated_productivity if productivity["id"] in warehouse_id_by_id],
+            commit=False,
+        )
+        if error_data:
+            BenchmarkProductivity.rollback()
+            raise CustomValidationError(
+                f"Could not update the benchmark productivity with ids {[row['id'] for row in error_data]}"
+            )
+        db.session.commit()
+        WarehouseController.increment_data_version(
+            {warehouse_id_by_id[productivity["id"]] for productivity in updated_productivity}, "productivity_version"
+        )
 
     @classmethod
     def get_benchmark_productivity_by_warehouse_id(cls, warehouse_id: int) -> list[dict] or None:
@@ -188,6 +264,26 @@ class BenchmarkProductivityController:
         records = BenchmarkProductivity.query.filter_by(warehouse_id=warehouse_id)
         return [record.serialize() for record in records]
 
+    @classmethod
+    def export_benchmark_productivity(cls, warehouse_id: int):
+        """
+        Get the benchmark productivity of a warehouse as record batches of EXPORT_SCHEMA, read a page at a time.
+        :param warehouse_id:
+        :return:
+        """
+        query = (
+            select(
+                BenchmarkProductivity.category_id,
+                Category.name,
+                BenchmarkProductivity.productivity_experienced_employee,
+                BenchmarkProductivity.productivity_new_employee,
+            )
+            .join(Category, Category.id == BenchmarkProductivity.category_id)
+            .filter(BenchmarkProductivity.warehouse_id == warehouse_id)
+        )
+        pages = iter_keyset_pages(query, [BenchmarkProductivity.category_id])
+        return iter_record_batches(pages, cls.EXPORT_SCHEMA)
+
     @classmethod
     def add_benchmark_category_from_excel_file_data(cls, file_data: list, warehouse_id: int):
         """
@@ -209,32 +305,64 @@ class BenchmarkProductivityController:
         ]
         return cls.add_benchmark_productivity(benchmark_productivity_data)
 
+    @classmethod
+    def import_productivity_file(cls, file: FileStorage, warehouse_id: int, progress=None) -> str | list | None:
+        """
+        Function to add the benchmark productivity of a warehouse, and the missing categories, from a file.
+        :param file:
+        :param warehouse_id:
+        :param progress: function called with the number of rows processed and the errors once the file is read.
+        :return: error of the file, None when it is imported.
+        """
+        df = read_file(file)
+
+        required_columns = ["category", "productivity_experienced_employee", "productivity_new_employee"]
+        missing_columns = set(required_columns) - set(df.columns)
+        extra_columns = set(df.columns) - set(required_columns)
+        if missing_columns:
+            return f"Missing columns: {missing_columns}."
+        elif extra_columns:
+            return f"Extra columns: {extra_columns}."
+
+        data = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+        category_data, error = CategoryController.convert_excel_file_data_according_to_category(data)
+        if progress:
+            progress(len(data), error)
+        if error:
+            return error
+
+        CategoryController.add_categories(category_data)
+        cls.add_benchmark_category_from_excel_file_data(data, warehouse_id)
+        return None
+
 
 class DemandController:
+    # Number of rows of a demand file which are validated and written at a time.
+    FILE_CHUNK_SIZE = 100
+    INTEGER_PATTERN = re.compile(r"\s*[+-]?\d+\s*")
+    NUMERIC_TYPES = {"integer", "floating", "mixed-integer-float", "empty"}
+    EXPORT_SCHEMA = pa.schema(
+        [("date", pa.date32()), ("category_id", pa.int64()), ("category", pa.string()), ("demand", pa.int64())]
+    )
+
     @classmethod
-    def add_demands(cls, demand_data: list) -> tuple[list, list]:
+    def add_demands(cls, demand_data: list, chunk_size: int = None) -> tuple[list, list]:
         """
-        Function to add demands.
+        Function to add demands, the demand of the dates and categories which already have one in the warehouse
+        is updated.
         :param demand_data:
+        :param chunk_size:
         :return:
         """
-        new_demand_with_ids = []
-        error_data = []
-        for demand in demand_data:
-            try:
-                _demand = InputDemand.create(demand)
-            except IntegrityError:
-                InputDemand.rollback()
-                _demand = InputDemand.query.filter_by(
-                    category_id=demand["category_id"], warehouse_id=demand["warehouse_id"], date=demand["date"]
-                ).first()
-                _demand.update(demand)
-            except Exception as e:
-                demand["error"] = str(e)
-                error_data.append(demand)
-                continue
-            demand.update({"id": _demand.id})
-            new_demand_with_ids.append(demand)
+        new_demand_with_ids, error_data = InputDemand.upsert_many(
+            demand_data,
+            key_columns=["warehouse_id", "category_id", "date"],
+            update_columns=["demand"],
+            chunk_size=chunk_size,
+        )
+        WarehouseController.increment_data_version(
+            {int(demand["warehouse_id"]) for demand in new_demand_with_ids}, "demand_version"
+        )
         return new_demand_with_ids, error_data
 
     @classmethod
@@ -247,113 +375,338 @@ class DemandController:
         :return:
         """
 
+        filters = (
+            InputDemand.warehouse_id == warehouse_id,
+            InputDemand.date >= start_date,
+            InputDemand.date <= end_date,
+        )
         records = (
-            db.session.query(InputDemand, Category)
+            db.session.query(
+                InputDemand.id,
+                InputDemand.date,
+                InputDemand.demand,
+                InputDemand.created_at,
+                InputDemand.updated_at,
+                Category.id.label("category_id"),
+                Category.name.label("category_name"),
+            )
             .join(Category, Category.id == InputDemand.category_id)
-            .filter(InputDemand.date >= start_date)
-            .filter(InputDemand.date <= end_date)
-            .filter(InputDemand.warehouse_id == warehouse_id)
+            .filter(*filters)
+        )
+        # The totals of every date, of every category and of all demands, as (date, category name, total) rows
+        # where the date and/or the category name is null.
+        totals = union_all(
+            select(InputDemand.date, null(), func.sum(InputDemand.demand)).filter(*filters).group_by(InputDemand.date),
+            select(null(), Category.name, func.sum(InputDemand.demand))
+            .join(Category, Category.id == InputDemand.category_id)
+            .filter(*filters)
+            .group_by(Category.name),
+            select(null(), null(), func.sum(InputDemand.demand)).filter(*filters),
         )
-        return cls.create_input_demands_data(records) if records else None
+        return cls.create_input_demands_data(records, db.session.execute(totals))
 
     @classmethod
-    def update_demand(cls, update_demand_data: list):
+    def export_demands(cls, warehouse_id: int, start_date: str = None, end_date: str = None):
         """
-        Update demands value from the updated list.
-        :param update_demand_data:
+        Get the demands of a warehouse, between two dates when they are given, as record batches of EXPORT_SCHEMA
+        read a page at a time.
+        :param warehouse_id:
+        :param start_date:
+        :param end_date:
         :return:
         """
-        for updated_demand in update_demand_data:
-            old_demand = InputDemand.query.filter_by(id=updated_demand["id"]).first()
+        query = (
+            select(InputDemand.date, InputDemand.category_id, Category.name, InputDemand.demand)
+            .join(Category, Category.id == InputDemand.category_id)
+            .filter(InputDemand.warehouse_id == warehouse_id)
+        )
+        if start_date:
+            query = query.filter(InputDemand.date >= start_date)
+        if end_date:
+            query = query.filter(InputDemand.date <= end_date)
+        pages = iter_keyset_pages(query, [InputDemand.date, InputDemand.category_id])
+        return iter_record_batches(pages, cls.EXPORT_SCHEMA)
 
-            if old_demand:
-                old_demand.update(updated_demand)
+    @staticmethod
+    def get_columnar_demands(demands: dict) -> dict:
+        """
+        Demands of get_demands_by_warehouse_id in the columnar format, with an id and a demand matrix.
+        :param demands:
+        :return:
+        """
+        return get_columnar_grid(demands, ["id", "demand"])
+
+    @classmethod
+    def update_demand(cls, update_demand_data: list) -> list[dict]:
+        """
+        Update demands value from the updated list. Nothing is updated when any of them can not be written.
+        :param update_demand_data:
+        :return: warehouse_id, date, category_id and the new demand of the updated records.
+        """
+        old_demands = {
+            record.id: record
+            for record in db.session.query(
+                InputDemand.id, InputDemand.warehouse_id, InputDemand.date, InputDemand.category_id, InputDemand.demand
+            ).filter(InputDemand.id.in_([demand["id"] for demand in update_demand_data]))
+        }
+        written_demands, error_data = InputDemand.update_many(
+            [demand for demand in update_demand_data if demand["id"] in old_demands], commit=False
+        )
+        if error_data:
+            InputDemand.rollback()
+            raise CustomValidationError(f"Could not update the demands with ids {[row['id'] for row in error_data]}")
+        db.session.commit()
+        updated_demands = [
+            {
+                "warehouse_id": old_demands[demand["id"]].warehouse_id,
+                "date": old_demands[demand["id"]].date,
+                "category_id": old_demands[demand["id"]].category_id,
+                "demand": demand.get("demand", old_demands[demand["id"]].demand),
+            }
+            for demand in written_demands
+        ]
+        WarehouseController.increment_data_version(
+            {demand["warehouse_id"] for demand in updated_demands}, "demand_version"
+        )
+        return updated_demands
 
     @staticmethod
-    def create_input_demands_data(records) -> dict:
+    def create_input_demands_data(records, totals) -> dict:
         """
         Function to create input demands data.
-        :param records:
+        :param records: (id, date, demand, created_at, updated_at, category_id, category_name) of the demands.
+        :param totals: (date, category_name, total) of the dates, of the categories and of all demands.
         :return:
         """
         output = {"total": {}}
-        # output = {}
         for record in records:
-            str_date = str(record.InputDemand.date)
-            if str_date not in output:
-                output[str_date] = {}
-            category_name = record.Category.name
-            output[str_date][category_name] = {
-                "id": record.InputDemand.id,
-                "demand": record.InputDemand.demand,
-                "created_on": record.InputDemand.created_at,
-                "category_id": record.Category.id,
-                "updated_on": record.InputDemand.updated_at,
+            output.setdefault(str(record.date), {})[record.category_name] = {
+                "id": record.id,
+                "demand": record.demand,
+                "created_on": record.created_at,
+                "category_id": record.category_id,
+                "updated_on": record.updated_at,
             }
-            output[str_date]["total"] = output[str_date].get("total", 0) + record.InputDemand.demand
-            output["total"][category_name] = output["total"].get(category_name, 0) + record.InputDemand.demand
-            output["total"]["total"] = output["total"].get("total", 0) + record.InputDemand.demand
+        for date, category_name, total in totals:
+            if total is None:
+                continue
+            elif date is not None:
+                output[str(date)]["total"] = int(total)
+            elif category_name is not None:
+                output["total"][category_name] = int(total)
+            else:
+                output["total"]["total"] = int(total)
 
         return output
 
     @classmethod
-    def check_and_convert_excel_data_according_to_input_demand(
-        cls, start_date, end_date, data: list, warehouse_id: int
-    ):
+    def import_demand_file(
+        cls, file: FileStorage, warehouse_id: int, start_date: str, end_date: str, progress=None
+    ) -> str | list | None:
         """
-        To validate and convert demand file data.
+        Function to add the demands of a warehouse from a demand file, with a date column and a column per category.
+        :param file:
+        :param warehouse_id:
         :param start_date:
         :param end_date:
-        :param data:
+        :param progress: function called with the number of rows processed and the errors so far after each chunk.
+        :return: error of the file, None when it is imported.
+        """
+        # The file is hashed before it is read in chunks, as the hash reads the stream from its start again.
+        file_hash = get_file_hash(file)
+        header, chunks = read_file_in_chunks(file, cls.FILE_CHUNK_SIZE)
+
+        if not header or str(header[0]).lower() != "date":
+            return "Date column is missing"
+
+        invalid_categories = CategoryController.check_invalid_categories(header[1:])
+        if invalid_categories:
+            return f"Invalid categories : [{invalid_categories}]"
+
+        if not start_date or not end_date:
+            return "start_date and end_date should be present in form data of requests"
+
+        # The same file is not imported again while the demands of the warehouse are unchanged since its import.
+        upload_key = {
+            "warehouse_id": warehouse_id,
+            "start_date": datetime.strptime(start_date, "%Y-%m-%d").date(),
+            "end_date": datetime.strptime(end_date, "%Y-%m-%d").date(),
+        }
+        upload = DemandFileUpload.query.filter_by(**upload_key).first()
+        if upload and upload.file_hash == file_hash and upload.demand_version == cls.get_demand_version(warehouse_id):
+            return None
+
+        error = cls.add_demands_from_file_chunks(chunks, header, start_date, end_date, warehouse_id, progress)
+        if error:
+            return error
+
+        DemandFileUpload.upsert_many(
+            [{**upload_key, "file_hash": file_hash, "demand_version": cls.get_demand_version(warehouse_id)}],
+            list(upload_key),
+            ["file_hash", "demand_version"],
+        )
+        return None
+
+    @staticmethod
+    def get_demand_version(warehouse_id: int) -> int:
+        return db.session.query(Warehouse.demand_version).filter_by(id=warehouse_id).scalar()
+
+    @staticmethod
+    def get_stored_demands(warehouse_id: int, dates: set) -> dict:
+        """
+        Get the demands of a warehouse on the given dates, keyed by category id and date.
         :param warehouse_id:
+        :param dates:
         :return:
         """
+        records = db.session.query(InputDemand.category_id, InputDemand.date, InputDemand.demand).filter(
+            InputDemand.warehouse_id == warehouse_id, InputDemand.date.in_(dates)
+        )
+        return {(record.category_id, record.date): record.demand for record in records}
+
+    @classmethod
+    def add_demands_from_file_chunks(
+        cls, chunks, header: tuple, start_date: str, end_date: str, warehouse_id: int, progress=None
+    ) -> list:
+        """
+        Validate the chunks of a demand file and upsert their demands chunk by chunk, so that only one chunk of the
+        file is in memory. Only the demands which differ from the stored ones of the dates of the chunk are written,
+        in one transaction which is rolled back when any row is invalid.
+        :param chunks: iterable of DataFrames of the rows of the file, with the columns numbered from 0.
+        :param header:
+        :param start_date:
+        :param end_date:
+        :param warehouse_id:
+        :param progress: function called with the number of rows processed and the errors so far after each chunk.
+        :return: errors of the file.
+        """
         category_name_to_id_mapping = Category.category_name_to_id_mapping()
-        error_data, output_data = [], []
+        category_id_to_name_mapping = {value: key for key, value in category_name_to_id_mapping.items()}
         start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
         end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-        days = (end_date - start_date).days
-        valid_dates = [start_date + timedelta(days=i) for i in range(days + 1)]
-        for record in data:
-            try:
-                date = datetime.fromtimestamp(record["date"] / 1000).date()
-                if date not in valid_dates:
-                    error_data.append(f"Invalid Date : {date}")
-                    continue
-                else:
-                    valid_dates.remove(date)
-            except Exception:
-                error_data.append(f"Invalid format for date : {record['date']}")
-                continue
+        missing_dates = {start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)}
+        error_data = []
+        num_rows = num_changes = 0
+        for chunk in chunks:
+            converted_data, error = cls.check_and_convert_excel_data_according_to_input_demand(
+                chunk, header, missing_dates, category_name_to_id_mapping, warehouse_id
+            )
+            error_data.extend(error)
+            changed_data = []
+            if not error_data and converted_data:
+                stored_demands = cls.get_stored_demands(warehouse_id, {row["date"] for row in converted_data})
+                changed_data = [
+                    row
+                    for row in converted_data
+                    if stored_demands.get((row["category_id"], row["date"])) != row["demand"]
+                ]
+            if changed_data:
+                # The ids of the demands are not needed, so they are not looked up.
+                _, write_errors = InputDemand.write_many(
+                    lambda chunk: InputDemand.upsert_rows(chunk, ["warehouse_id", "category_id", "date"], ["demand"]),
+                    changed_data,
+                    commit=False,
+                )
+                error_data.extend(
+                    f"Demand ({row['demand']}) could not be saved for date : {row['date']} "
+                    f"category : {category_id_to_name_mapping[row['category_id']]}"
+                    for row in write_errors
+                )
+                num_changes += len(changed_data)
+            num_rows += len(chunk)
+            if progress:
+                progress(num_rows, error_data)
+        if missing_dates:
+            error_data.append(f"Data not found for : [{', '.join(str(date) for date in sorted(missing_dates))}]")
+        if error_data:
+            InputDemand.rollback()
+            return error_data
 
-            for key in record:
-                if key == "date":
-                    continue
-                try:
-                    if isinstance(record[key], float):
-                        decimal_part = str(record[key]).split(".")[1]
-                        if decimal_part != "0":
-                            raise
-                    demand = int(record[key])
-                except Exception:
-                    error_data.append(f"Invalid Demand ({record[key]}) for date : {date} category : {key}")
-                    continue
-                if demand <= 0:
-                    error_data.append(
-                        f"Demand ({record[key]}) should be greater then 0 for date : {date} category : {key}"
-                    )
-                    continue
-                output_data.append(
-                    {
-                        "warehouse_id": warehouse_id,
-                        "category_id": category_name_to_id_mapping[key],
-                        "date": date,
-                        "demand": demand,
-                    }
+        db.session.commit()
+        if num_changes:
+            WarehouseController.increment_data_version({warehouse_id}, "demand_version")
+        return error_data
+
+    @staticmethod
+    def get_cell_text(value) -> str:
+        """
+        To get the text of a cell of a demand file for an error, a missing cell is None whatever the file format.
+        :param value:
+        :return:
+        """
+        return "None" if pd.isna(value) else str(value)
+
+    @classmethod
+    def check_and_convert_excel_data_according_to_input_demand(
+        cls, df: pd.DataFrame, header: tuple, missing_dates: set, category_name_to_id_mapping: dict, warehouse_id: int
+    ) -> (list, list):
+        """
+        To validate and convert a chunk of the rows of a demand file. The dates found in the rows are removed from
+        missing_dates, a date which is not in it is out of the date range of the file or repeated. The demand cells
+        are checked column-wise on the whole chunk.
+        :param df: the rows, with the columns numbered from 0.
+        :param header:
+        :param missing_dates:
+        :param category_name_to_id_mapping:
+        :param warehouse_id:
+        :return:
+        """
+        df = df.reset_index(drop=True)
+        error_data = []  # (row, column, error), sorted to list the errors row by row.
+
+        dates = [get_date(value) for value in df[0]]
+        is_valid_date = np.zeros(len(dates), dtype=bool)
+        for row, (value, date) in enumerate(zip(df[0], dates)):
+            if date is None:
+                error_data.append((row, -1, f"Invalid format for date : {cls.get_cell_text(value)}"))
+            elif date not in missing_dates:
+                error_data.append((row, -1, f"Invalid Date : {date}"))
+            else:
+                missing_dates.remove(date)
+                is_valid_date[row] = True
+
+        values = df.iloc[:, 1:]
+        demand = values.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        is_integer = np.isfinite(demand) & (demand == np.floor(demand))
+        # Text cells, e.g. "12", are integers only when they are written as one. Only the columns which are not
+        # all numbers are looked at cell by cell.
+        is_text = np.zeros(demand.shape, dtype=bool)
+        for column in range(values.shape[1]):
+            if pd.api.types.infer_dtype(values.iloc[:, column], skipna=True) not in cls.NUMERIC_TYPES:
+                is_text[:, column] = values.iloc[:, column].map(lambda value: isinstance(value, str))
+        for row, column in zip(*np.nonzero(is_text)):
+            is_integer[row, column] = cls.INTEGER_PATTERN.fullmatch(values.iat[row, column]) is not None
+        is_positive = is_integer & (np.where(is_integer, demand, 0) > 0)
+
+        category_names = header[1:]
+        for row, column in zip(*np.nonzero(is_valid_date[:, None] & ~is_integer)):
+            error_data.append(
+                (
+                    row,
+                    column,
+                    f"Invalid Demand ({cls.get_cell_text(values.iat[row, column])}) for date : {dates[row]} "
+                    f"category : {category_names[column]}",
                 )
-        if valid_dates:
-            error_data.append(f"Data not found for : [{', '.join(str(date) for date in valid_dates)}]")
-        return output_data, error_data
+            )
+        for row, column in zip(*np.nonzero(is_valid_date[:, None] & is_integer & ~is_positive)):
+            error_data.append(
+                (
+                    row,
+                    column,
+                    f"Demand ({values.iat[row, column]}) should be greater then 0 for date : {dates[row]} "
+                    f"category : {category_names[column]}",
+                )
+            )
+
+        category_ids = [category_name_to_id_mapping.get(name) for name in category_names]
+        rows, columns = np.nonzero(is_valid_date[:, None] & is_positive)
+        output_data = [
+            {"warehouse_id": warehouse_id, "category_id": category_ids[column], "date": dates[row], "demand": demand}
+            for row, column, demand in zip(
+                rows.tolist(), columns.tolist(), demand[rows, columns].astype(np.int64).tolist()
+            )
+        ]
+        return output_data, [error for _, _, error in sorted(error_data, key=lambda error: error[:2])]
 
 
 class RequirementController:
@@ -377,101 +730,856 @@ class RequirementController:
         records = InputRequirements.query.filter_by(warehouse_id=warehouse_id)
         return [record.serialize() for record in records]
 
+    @classmethod
+    def get_requirement_by_id(cls, requirement_id: int):
+        """
+        Get input requirement by requirement_id.
+        :param requirement_id:
+        :return:
+        """
+        return InputRequirements.query.filter_by(id=requirement_id).first()
+
+    @staticmethod
+    def get_requirement_data(requirement: InputRequirements) -> dict:
+        """
+        Get the fields of a stored requirement as they are accepted by the calculation.
+        :param requirement:
+        :return:
+        """
+        return {field: getattr(requirement, field) for field in RequirementValidator().fields}
+
 
 class ResultController:
+    # Fields of the cells of the output and of the demand vs fulfillment data of a result.
+    OUTPUT_FIELDS = ["num_of_existing_to_deploy", "num_of_new_to_deploy", "total"]
+    FULFILLMENT_FIELDS = [
+        "expected_demand",
+        "fulfillment_with_current",
+        "fulfillment_with_total",
+        *(f"fulfillment_p{percentile}" for percentile in RISK_PERCENTILES),
+    ]
+    # Sheets of the Excel export of plans and their fields, and the number of rows of a sheet.
+    EXCEL_SHEETS = {"Plan": OUTPUT_FIELDS, "Demand vs fulfillment": FULFILLMENT_FIELDS}
+    EXCEL_MAX_ROWS = 1048576
 
     @classmethod
     def calculate_manpower(cls, requirement_data: dict) -> dict:
         """
-        Function to calculate manpower.
+        Function to calculate manpower. If the same requirement was already calculated on the current demand and
+        productivity of the warehouse, the stored result is returned.
         :param requirement_data:
         :return:
         """
+        warehouse = WarehouseController.get_warehouse_by_id(requirement_data["warehouse_id"])
+        if not warehouse:
+            raise RecordNotFoundError()
+        fingerprint = cls.get_fingerprint(requirement_data, warehouse)
+        stored_result = CalculationResult.query.filter_by(fingerprint=fingerprint).first()
+        if stored_result:
+            return current_app.json.loads(stored_result.result)
+
         new_requirement = RequirementController.add_requirement(requirement_data)
-        expected_demand = DemandController.get_demands_by_warehouse_id(
-            new_requirement.warehouse_id, new_requirement.plan_from_date, new_requirement.plan_to_date
+        return cls.solve_requirement(new_requirement, requirement_data, warehouse, fingerprint)
+
+    @classmethod
+    def solve_requirement(
+        cls, requirement: InputRequirements, requirement_data: dict, warehouse: Warehouse, fingerprint: str
+    ) -> dict:
+        """
+        Calculate the manpower of a requirement from scratch and store the result with its solved state.
+        :param requirement:
+        :param requirement_data:
+        :param warehouse:
+        :param fingerprint:
+        :return:
+        """
+        requirement_data["expected_demand"] = DemandController.get_demands_by_warehouse_id(
+            requirement.warehouse_id, requirement.plan_from_date, requirement.plan_to_date
+        )
+        requirement_data["productivity"] = BenchmarkProductivityController.get_benchmark_productivity_by_warehouse_id(
+            requirement.warehouse_id
+        )
+
+        grid = cls.get_plan_grid(requirement.warehouse_id, requirement.plan_from_date, requirement.plan_to_date)
+        solution = solve_headcount(
+            grid.demand,
+            grid.productivity_experienced,
+            grid.productivity_new,
+            requirement.num_current_employees,
+            requirement.percentage_absent_expected,
+            requirement.day_working_hours,
+            requirement.total_hiring_budget,
+            requirement.cost_per_employee_per_month,
         )
-        productivity = BenchmarkProductivityController.get_benchmark_productivity_by_warehouse_id(
-            new_requirement.warehouse_id
+        # Seeded with the requirement so that an incremental recalculation draws the same attendance.
+        solution["attendance_percentiles"] = simulate_attendance(
+            len(grid.dates), requirement.percentage_absent_expected, seed=requirement.id
         )
+        cls.add_fulfillment_bands(requirement, grid, solution)
+        category_names = cls.get_category_names(grid)
+        result = {
+            "input_data": requirement_data,
+            "requirement_id": requirement.id,
+            "output": cls.get_output(grid, solution, category_names),
+            "demand_vs_fulfillment_data": cls.get_demand_vs_fulfillment_data(grid, solution, category_names),
+            "additional_data": cls.get_additional_data(requirement, grid, solution),
+            "warehouse_name": warehouse.name,
+        }
+        cls.store_result(requirement, warehouse, fingerprint, result, grid, solution)
+        return result
+
+    @classmethod
+    def recalculate_manpower(cls, requirement_id: int, update_demand_data: list) -> dict:
+        """
+        Update demands and recalculate the manpower of a requirement. Only the dates and categories affected by the
+        updated demands are solved again on the last solved state of the requirement, and its stored result is
+        patched in place. Without a state which matches the current demand, the requirement is solved from scratch.
+        :param requirement_id:
+        :param update_demand_data:
+        :return:
+        """
+        requirement = RequirementController.get_requirement_by_id(requirement_id)
+        if not requirement:
+            raise RecordNotFoundError()
+        warehouse = WarehouseController.get_warehouse_by_id(requirement.warehouse_id)
+        stored_result = CalculationResult.query.filter_by(requirement_id=requirement.id).first()
+        is_state_current = bool(stored_result and stored_result.demand_version == warehouse.demand_version)
+
+        updated_demands = [
+            demand
+            for demand in DemandController.update_demand(update_demand_data)
+            if demand["warehouse_id"] == requirement.warehouse_id
+            and requirement.plan_from_date <= demand["date"] <= requirement.plan_to_date
+        ]
+        requirement_data = RequirementController.get_requirement_data(requirement)
+        fingerprint = cls.get_fingerprint(requirement_data, warehouse)
+        if not is_state_current:
+            return cls.solve_requirement(requirement, requirement_data, warehouse, fingerprint)
 
-        requirement_data["expected_demand"] = expected_demand
-        requirement_data["productivity"] = productivity
+        grid, solution = load_state(stored_result.state)
+        if "fulfillment_bands" not in solution:
+            return cls.solve_requirement(requirement, requirement_data, warehouse, fingerprint)
+        rows = np.array([(demand["date"] - grid.start_date).days for demand in updated_demands], dtype=np.int64)
+        category_ids = np.array([demand["category_id"] for demand in updated_demands], dtype=np.int64)
+        columns = np.searchsorted(grid.category_ids, category_ids)
+        if np.any(columns >= len(grid.category_ids)) or not (
+            np.all(grid.category_ids[columns] == category_ids) and grid.mask[rows, columns].all()
+        ):
+            return cls.solve_requirement(requirement, requirement_data, warehouse, fingerprint)
 
-        result = cls.get_dummy_output(requirement_data)
+        old_demand = grid.demand.copy()
+        grid.demand[rows, columns] = [demand["demand"] for demand in updated_demands]
+        new_solution = solve_dates(
+            grid,
+            solution,
+            np.unique(rows),
+            requirement.num_current_employees,
+            requirement.percentage_absent_expected,
+            requirement.day_working_hours,
+            requirement.total_hiring_budget,
+            requirement.cost_per_employee_per_month,
+        )
+        cls.add_fulfillment_bands(requirement, grid, new_solution)
+        result = current_app.json.loads(stored_result.result)
+        cls.patch_result(result, grid, old_demand, solution, new_solution)
+        result["additional_data"] = cls.get_additional_data(requirement, grid, new_solution)
+        cls.store_result(requirement, warehouse, fingerprint, result, grid, new_solution)
+        return result
 
-        additional_data = {
-            "project_fulfillment": randint(80, 96),
-            "total_hiring_budget": requirement_data["total_hiring_budget"] - randint(100, 1000),
+    @staticmethod
+    def get_fingerprint(requirement_data: dict, warehouse: Warehouse) -> str:
+        """
+        Fingerprint of the requirement fields and of the versions of the warehouse data the calculation uses, with
+        the version of the categories as their names are in the result.
+        :param requirement_data:
+        :param warehouse:
+        :return:
+        """
+        data = RequirementValidator().dump(requirement_data)
+        data.update(
+            demand_version=warehouse.demand_version,
+            productivity_version=warehouse.productivity_version,
+            category_version=Category.get_version(),
+        )
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def store_result(
+        requirement: InputRequirements,
+        warehouse: Warehouse,
+        fingerprint: str,
+        result: dict,
+        grid: PlanGrid,
+        solution: dict,
+    ):
+        """
+        Store the result of a calculation against its fingerprint, together with the solved state of the
+        requirement so that it can be recalculated incrementally.
+        :param requirement:
+        :param warehouse:
+        :param fingerprint:
+        :param result:
+        :param grid:
+        :param solution:
+        :return:
+        """
+        data = {
+            "warehouse_id": warehouse.id,
+            "requirement_id": requirement.id,
+            "fingerprint": fingerprint,
+            "demand_version": warehouse.demand_version,
+            "result": current_app.json.dumps(result),
+            "state": dump_state(grid, solution),
         }
+        stored_result = CalculationResult.query.filter_by(requirement_id=requirement.id).first()
+        try:
+            if stored_result:
+                stored_result.update(data)
+            else:
+                CalculationResult.create(data)
+        except IntegrityError:
+            # The same calculation was stored by a concurrent request.
+            CalculationResult.rollback()
+
+    @staticmethod
+    def get_plan_grid(warehouse_id: int, start_date, end_date) -> PlanGrid:
+        """
+        Load the demand and the benchmark productivity of a warehouse as dense NumPy arrays.
+        :param warehouse_id:
+        :param start_date:
+        :param end_date:
+        :return:
+        """
+        demand_rows = (
+            db.session.query(InputDemand.date, InputDemand.category_id, InputDemand.demand)
+            .filter(InputDemand.warehouse_id == warehouse_id)
+            .filter(InputDemand.date >= start_date)
+            .filter(InputDemand.date <= end_date)
+            .all()
+        )
+        productivity_rows = (
+            db.session.query(
+                BenchmarkProductivity.category_id,
+                BenchmarkProductivity.productivity_experienced_employee,
+                BenchmarkProductivity.productivity_new_employee,
+            )
+            .filter(BenchmarkProductivity.warehouse_id == warehouse_id)
+            .all()
+        )
+        return build_plan_grid(start_date, end_date, demand_rows, productivity_rows)
+
+    @staticmethod
+    def get_category_names(grid: PlanGrid) -> list:
+        """
+        Names of the categories of a grid, in the order of its columns.
+        :param grid:
+        :return:
+        """
+        category_id_to_name_mapping = Category.category_id_to_name_mapping()
+        return [category_id_to_name_mapping[category_id] for category_id in grid.category_ids.tolist()]
+
+    @staticmethod
+    def get_output_cell(category_id: int, num_existing: int, num_new: int) -> dict:
         return {
-            "input_data": requirement_data,
-            "requirement_id": new_requirement.id,
-            "output": result,
-            "demand_vs_fulfillment_data": cls.get_demand_vs_fulfillment_dummy_data(requirement_data),
-            "additional_data": additional_data,
-            "warehouse_name": WarehouseController.get_warehouse_by_id(new_requirement.warehouse_id).name,
+            "num_of_existing_to_deploy": num_existing,
+            "num_of_new_to_deploy": num_new,
+            "category_id": category_id,
+            "total": num_existing + num_new,
         }
 
     @staticmethod
-    def get_dummy_output(requirement_data: dict) -> dict:
+    def add_fulfillment_bands(requirement: InputRequirements, grid: PlanGrid, solution: dict):
         """
-        To get dummy output data until algorithm is not merged.
-        :param requirement_data:
+        Add the P10, P50 and P90 fulfillment of every cell, under the simulated daily absenteeism, to a solution.
+        :param requirement:
+        :param grid:
+        :param solution:
         :return:
         """
-        category_name_to_id_mapping = Category.category_name_to_id_mapping()
-        dummy_output = {}
-        for date in requirement_data["expected_demand"]:
-            if date == "extra" or date == "total":
+        solution["fulfillment_bands"] = get_fulfillment_bands(
+            grid.demand,
+            solution,
+            grid.productivity_experienced,
+            grid.productivity_new,
+            solution["attendance_percentiles"],
+            requirement.percentage_absent_expected,
+            requirement.day_working_hours,
+        )
+
+    @staticmethod
+    def get_rounded_fulfillment(demand: np.ndarray, solution: dict) -> dict:
+        """
+        The demand and the fulfilled demand matrices of a solution, as integers keyed by their name in the result.
+        :param demand:
+        :param solution:
+        :return:
+        """
+        fulfillment = {
+            "expected_demand": demand,
+            "fulfillment_with_current": solution["fulfillment_with_current"],
+            "fulfillment_with_total": solution["fulfillment_with_total"],
+        }
+        for percentile, band in zip(RISK_PERCENTILES, solution["fulfillment_bands"]):
+            fulfillment[f"fulfillment_p{percentile}"] = band
+        return {key: np.rint(value).astype(np.int64) for key, value in fulfillment.items()}
+
+    @classmethod
+    def get_output(cls, grid: PlanGrid, solution: dict, category_names: list) -> dict:
+        """
+        Convert the solved headcount matrices to the {date: {category: {...}}} output format.
+        :param grid:
+        :param solution:
+        :param category_names:
+        :return:
+        """
+        category_ids = grid.category_ids.tolist()
+        output = {}
+        for date, mask, existing, new in zip(
+            grid.dates, grid.mask.tolist(), solution["existing"].tolist(), solution["new"].tolist()
+        ):
+            if not any(mask):
+                continue
+            output[str(date)] = {
+                name: cls.get_output_cell(category_id, num_existing, num_new)
+                for name, category_id, present, num_existing, num_new in zip(
+                    category_names, category_ids, mask, existing, new
+                )
+                if present
+            }
+
+        return output
+
+    @classmethod
+    def get_demand_vs_fulfillment_data(cls, grid: PlanGrid, solution: dict, category_names: list) -> dict:
+        """
+        Demand and the demand fulfilled with the current and with all the employees, per date and category with
+        a total per date. The P10, P50 and P90 fulfillment give the risk due to the daily absenteeism.
+        :param grid:
+        :param solution:
+        :param category_names:
+        :return:
+        """
+        category_ids = grid.category_ids.tolist()
+        fulfillment = {key: value.tolist() for key, value in cls.get_rounded_fulfillment(grid.demand, solution).items()}
+        output = {}
+        for row, (date, mask) in enumerate(zip(grid.dates, grid.mask.tolist())):
+            if not any(mask):
                 continue
-            if date not in dummy_output:
-                dummy_output[date] = dict()
-            for category in requirement_data["expected_demand"][date]:
-                if category == "total":
-                    continue
-                existing = randint(2, 7)
-                new = randint(2, 7)
-                dummy_output[date][category] = {
-                    "num_of_existing_to_deploy": existing,
-                    "num_of_new_to_deploy": new,
-                    "category_id": category_name_to_id_mapping[category],
-                    "total": existing + new,
+            output[str(date)] = {
+                name: {
+                    **{key: value[row][column] for key, value in fulfillment.items()},
+                    "category_id": category_id,
                 }
+                for column, (name, category_id, present) in enumerate(zip(category_names, category_ids, mask))
+                if present
+            }
+            output[str(date)]["total"] = {key: sum(value[row]) for key, value in fulfillment.items()}
+
+        return output
 
-        return dummy_output
+    @classmethod
+    def export_result(cls, requirement_id: int) -> pa.Table or None:
+        """
+        Get the stored plan of a requirement as a table with a row per date and category, built column by column
+        from its solved arrays. None when the requirement has no stored plan.
+        :param requirement_id:
+        :return:
+        """
+        stored_result = CalculationResult.query.filter_by(requirement_id=requirement_id).first()
+        if not stored_result or not stored_result.state:
+            return None
+
+        grid, solution = load_state(stored_result.state)
+        rows, columns = np.nonzero(grid.mask)
+        category_names = np.array(cls.get_category_names(grid), dtype=object)
+        fulfillment = {"expected_demand": np.rint(grid.demand).astype(np.int64)}
+        if "fulfillment_bands" in solution:
+            fulfillment = cls.get_rounded_fulfillment(grid.demand, solution)
+        return pa.table(
+            {
+                "date": np.datetime64(grid.start_date, "D") + rows,
+                "category_id": grid.category_ids[columns],
+                "category": category_names[columns],
+                "num_of_existing_to_deploy": solution["existing"][rows, columns],
+                "num_of_new_to_deploy": solution["new"][rows, columns],
+                "total": solution["existing"][rows, columns] + solution["new"][rows, columns],
+                **{key: value[rows, columns] for key, value in fulfillment.items()},
+            }
+        )
 
     @staticmethod
-    def get_demand_vs_fulfillment_dummy_data(requirement_data: dict) -> dict:
+    def get_plan_warehouse_names(requirement_ids: list) -> dict:
+        """
+        Get the warehouse name of the requirements which have a stored plan.
+        :param requirement_ids:
+        :return: {requirement_id: warehouse_name}
         """
-        To get dummy demand vs fulfillment data until algorithm is not merged.
+        records = (
+            db.session.query(CalculationResult.requirement_id, Warehouse.name)
+            .join(Warehouse, Warehouse.id == CalculationResult.warehouse_id)
+            .filter(CalculationResult.requirement_id.in_(requirement_ids), CalculationResult.state.isnot(None))
+        )
+        return {record.requirement_id: record.name for record in records}
+
+    @classmethod
+    def export_plans_excel(cls, warehouse_names: dict) -> str:
+        """
+        Write the stored plans of requirements to a temporary Excel file, with a sheet of the headcount and a sheet
+        of the demand vs fulfillment which have a row per requirement, date and category. The workbook is written
+        in xlsxwriter's constant_memory mode, where each row is flushed to disk once the next one is started, so
+        only the plan of one requirement is in memory at a time, and it is loaded once for both sheets.
+        :param warehouse_names: {requirement_id: warehouse_name} of the plans.
+        :return: path of the file, which the caller removes.
+        """
+        file_descriptor, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(file_descriptor)
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+        headers = {
+            sheet_name: ["warehouse", "requirement_id", "date", "category", *fields]
+            for sheet_name, fields in cls.EXCEL_SHEETS.items()
+        }
+        # The worksheets of each sheet and the next row of the last of them.
+        worksheets = {sheet_name: [workbook.add_worksheet(sheet_name)] for sheet_name in cls.EXCEL_SHEETS}
+        rows = dict.fromkeys(cls.EXCEL_SHEETS, 1)
+        for sheet_name, header in headers.items():
+            worksheets[sheet_name][-1].write_row(0, 0, header)
+        for requirement_id, warehouse_name in warehouse_names.items():
+            # Each sheet is written from the same table, a worksheet only needs its own rows to be in order.
+            table = cls.export_result(requirement_id)
+            for sheet_name, fields in cls.EXCEL_SHEETS.items():
+                columns = [
+                    table.column(field).to_pylist() if field in table.column_names else [None] * table.num_rows
+                    for field in ["date", "category", *fields]
+                ]
+                sheet_worksheets, row = worksheets[sheet_name], rows[sheet_name]
+                for date, *values in zip(*columns):
+                    # A sheet which is full is continued on a new one.
+                    if row == cls.EXCEL_MAX_ROWS:
+                        sheet_worksheets.append(workbook.add_worksheet(f"{sheet_name} ({len(sheet_worksheets) + 1})"))
+                        sheet_worksheets[-1].write_row(0, 0, headers[sheet_name])
+                        row = 1
+                    sheet_worksheets[-1].write_string(row, 0, warehouse_name)
+                    sheet_worksheets[-1].write_number(row, 1, requirement_id)
+                    sheet_worksheets[-1].write_datetime(row, 2, date, date_format)
+                    sheet_worksheets[-1].write_row(row, 3, values)
+                    row += 1
+                rows[sheet_name] = row
+        workbook.close()
+        return path
+
+    @classmethod
+    def get_columnar_result(cls, result: dict) -> dict:
+        """
+        A calculation result with its demand, output and demand vs fulfillment grids in the columnar format.
+        :param result:
+        :return:
+        """
+        return {
+            **result,
+            "input_data": {
+                **result["input_data"],
+                "expected_demand": DemandController.get_columnar_demands(result["input_data"]["expected_demand"]),
+            },
+            "output": get_columnar_grid(result["output"], cls.OUTPUT_FIELDS),
+            "demand_vs_fulfillment_data": get_columnar_grid(
+                result["demand_vs_fulfillment_data"], cls.FULFILLMENT_FIELDS
+            ),
+        }
+
+    @staticmethod
+    def get_additional_data(requirement: InputRequirements, grid: PlanGrid, solution: dict) -> dict:
+        """
+        Plan wide figures: fulfillment percentage, hiring cost and the budget left.
+        :param requirement:
+        :param grid:
+        :param solution:
+        :return:
+        """
+        hiring_cost = float(solution["hiring_cost"])
+        return {
+            "project_fulfillment": round(
+                100 * float(safe_divide(solution["fulfillment_with_total"].sum(), grid.demand.sum())), 2
+            ),
+            "total_hiring_budget": requirement.total_hiring_budget - hiring_cost,
+            "hiring_cost": hiring_cost,
+        }
+
+    @classmethod
+    def patch_result(cls, result: dict, grid: PlanGrid, old_demand: np.ndarray, old_solution: dict, solution: dict):
+        """
+        Patch the cells of a result whose demand or solution changed, and adjust the totals by the differences
+        instead of computing them again.
+        :param result:
+        :param grid:
+        :param old_demand:
+        :param old_solution:
+        :param solution:
+        :return:
+        """
+        old_fulfillment = cls.get_rounded_fulfillment(old_demand, old_solution)
+        fulfillment = cls.get_rounded_fulfillment(grid.demand, solution)
+        changed = (old_solution["existing"] != solution["existing"]) | (old_solution["new"] != solution["new"])
+        for key, value in fulfillment.items():
+            changed |= old_fulfillment[key] != value
+        changed &= grid.mask
+        if not changed.any():
+            return
+
+        category_names = cls.get_category_names(grid)
+        expected_demand = result["input_data"]["expected_demand"]
+        for row, column in zip(*np.nonzero(changed)):
+            str_date, name = str(grid.start_date + timedelta(days=int(row))), category_names[column]
+            result["output"][str_date][name] = cls.get_output_cell(
+                int(grid.category_ids[column]),
+                int(solution["existing"][row, column]),
+                int(solution["new"][row, column]),
+            )
+
+            date_fulfillment = result["demand_vs_fulfillment_data"][str_date]
+            for key, value in fulfillment.items():
+                date_fulfillment[name][key] = int(value[row, column])
+                date_fulfillment["total"][key] += int(value[row, column] - old_fulfillment[key][row, column])
+
+            demand, old = int(grid.demand[row, column]), int(old_demand[row, column])
+            if demand != old:
+                expected_demand[str_date][name]["demand"] = demand
+                expected_demand[str_date]["total"] += demand - old
+                expected_demand["total"][name] += demand - old
+                expected_demand["total"]["total"] += demand - old
+
+
+class ScenarioController:
+    """
+    This controller is used to compare many variants of a requirement in one calculation.
+    """
+
+    SWEEP_FIELDS = ["percentage_absent_expected", "day_working_hours", "total_hiring_budget"]
+
+    @classmethod
+    def compare_scenarios(cls, scenario_data: dict) -> dict:
+        """
+        Solve every combination of the swept requirement fields on the demand and productivity of the warehouse,
+        which are loaded once.
+        :param scenario_data:
+        :return: a table with one row per scenario.
+        """
+        if not WarehouseController.get_warehouse_by_id(scenario_data["warehouse_id"]):
+            raise RecordNotFoundError()
+        grid = ResultController.get_plan_grid(
+            scenario_data["warehouse_id"], scenario_data["plan_from_date"], scenario_data["plan_to_date"]
+        )
+        sweeps = [
+            sweep.ravel() for sweep in np.meshgrid(*(scenario_data[field] for field in cls.SWEEP_FIELDS), indexing="ij")
+        ]
+        totals = solve_scenarios(
+            grid,
+            scenario_data["num_current_employees"],
+            *sweeps,
+            scenario_data["cost_per_employee_per_month"],
+        )
+        project_fulfillment = np.round(100 * safe_divide(totals["fulfillment_with_total"], grid.demand.sum()), 2)
+        current_fulfillment = np.round(100 * safe_divide(totals["fulfillment_with_current"], grid.demand.sum()), 2)
+        columns = cls.SWEEP_FIELDS + [
+            "num_of_existing_to_deploy",
+            "num_of_new_to_deploy",
+            "hiring_cost",
+            "current_fulfillment",
+            "project_fulfillment",
+        ]
+        rows = np.column_stack(
+            sweeps
+            + [
+                totals["existing"],
+                totals["new"],
+                np.round(totals["hiring_cost"], 2),
+                current_fulfillment,
+                project_fulfillment,
+            ]
+        )
+        return {"warehouse_id": scenario_data["warehouse_id"], "columns": columns, "rows": rows.tolist()}
+
+
+class PortfolioController:
+    """
+    This controller is used to plan many warehouses for the same date range in one request.
+    """
+
+    PARAMETER_FIELDS = [
+        "num_current_employees",
+        "percentage_absent_expected",
+        "day_working_hours",
+        "total_hiring_budget",
+        "cost_per_employee_per_month",
+    ]
+    TOTAL_FIELDS = [
+        "expected_demand",
+        "existing",
+        "new",
+        "fulfillment_with_current",
+        "fulfillment_with_total",
+        "hiring_cost",
+    ]
+
+    # Pool of the processes which solve the warehouses, created on the first portfolio of this process. Its
+    # processes are started from a fork server, as a web worker has threads and connections which a fork copies.
+    process_pool = None
+
+    @classmethod
+    def plan_portfolio(cls, portfolio_data: dict) -> dict:
+        """
+        Plan the requirement for every warehouse, or for the given warehouses, with the totals of each warehouse and
+        of the whole network. Each warehouse is planned with the current employees and the hiring budget of the
+        requirement, which are per warehouse, and the totals of the network are the sums of the ones of the
+        warehouses. The demand and productivity of all the warehouses are loaded with one query each and the
+        warehouses are solved in parallel across the process pool.
+        :param portfolio_data:
+        :return:
+        """
+        warehouse_ids = portfolio_data.get("warehouse_ids")
+        query = Warehouse.query
+        if warehouse_ids:
+            query = query.filter(Warehouse.id.in_(warehouse_ids))
+        warehouses = query.order_by(Warehouse.id).all()
+        if warehouse_ids and len(warehouses) != len(set(warehouse_ids)):
+            raise RecordNotFoundError()
+
+        grids = cls.get_plan_grids(
+            [warehouse.id for warehouse in warehouses], portfolio_data["plan_from_date"], portfolio_data["plan_to_date"]
+        )
+        site_totals = cls.solve_grids(grids, [portfolio_data[field] for field in cls.PARAMETER_FIELDS])
+
+        sites, network_totals = [], dict.fromkeys(cls.TOTAL_FIELDS, 0.0)
+        for warehouse, grid, totals in zip(warehouses, grids, site_totals):
+            totals = {key: float(value[0]) for key, value in totals.items()}
+            totals["expected_demand"] = float(grid.demand.sum())
+            for key in cls.TOTAL_FIELDS:
+                network_totals[key] += totals[key]
+            sites.append({"warehouse_id": warehouse.id, "warehouse_name": warehouse.name, **cls.get_summary(totals)})
+        return {
+            "plan_from_date": str(portfolio_data["plan_from_date"]),
+            "plan_to_date": str(portfolio_data["plan_to_date"]),
+            "warehouses": sites,
+            "total": cls.get_summary(network_totals),
+        }
+
+    @staticmethod
+    def get_plan_grids(warehouse_ids: list, start_date, end_date) -> list:
+        """
+        Load the demand and the benchmark productivity of many warehouses as one PlanGrid per warehouse.
+        :param warehouse_ids:
+        :param start_date:
+        :param end_date:
+        :return: grids in the order of the warehouse ids.
+        """
+        demand_rows, productivity_rows = defaultdict(list), defaultdict(list)
+        for warehouse_id, *row in (
+            db.session.query(InputDemand.warehouse_id, InputDemand.date, InputDemand.category_id, InputDemand.demand)
+            .filter(InputDemand.warehouse_id.in_(warehouse_ids))
+            .filter(InputDemand.date >= start_date)
+            .filter(InputDemand.date <= end_date)
+        ):
+            demand_rows[warehouse_id].append(row)
+        for warehouse_id, *row in db.session.query(
+            BenchmarkProductivity.warehouse_id,
+            BenchmarkProductivity.category_id,
+            BenchmarkProductivity.productivity_experienced_employee,
+            BenchmarkProductivity.productivity_new_employee,
+        ).filter(BenchmarkProductivity.warehouse_id.in_(warehouse_ids)):
+            productivity_rows[warehouse_id].append(row)
+        return [
+            build_plan_grid(start_date, end_date, demand_rows[warehouse_id], productivity_rows[warehouse_id])
+            for warehouse_id in warehouse_ids
+        ]
+
+    @classmethod
+    def solve_grids(cls, grids: list, parameters: list) -> list:
+        """
+        Solve the same requirement parameters on many grids. The grids are sent to the process pool as NumPy arrays
+        and solved in parallel, unless there is a single grid or a single worker.
+        :param grids:
+        :param parameters:
+        :return: the totals of `solve_scenarios` for each grid.
+        """
+        max_workers = current_app.config.get("PORTFOLIO_MAX_WORKERS") or 1
+        if len(grids) <= 1 or max_workers <= 1:
+            return [solve_scenarios(grid, *parameters) for grid in grids]
+        if cls.process_pool is None:
+            mp_context = multiprocessing.get_context("forkserver")
+            mp_context.set_forkserver_preload(["main.modules.warehouse_manpower.solver"])
+            cls.process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+        try:
+            return list(cls.process_pool.map(solve_scenarios, grids, *(repeat(parameter) for parameter in parameters)))
+        except BrokenProcessPool:
+            # A worker died, the next portfolio starts a new pool.
+            cls.process_pool = None
+            raise
+
+    @classmethod
+    def shutdown_process_pool(cls):
+        """
+        Stop the processes of the pool, the next portfolio starts a new pool.
+        :return:
+        """
+        if cls.process_pool is not None:
+            cls.process_pool.shutdown(cancel_futures=True)
+            cls.process_pool = None
+
+    @staticmethod
+    def get_summary(totals: dict) -> dict:
+        """
+        Headcount, cost and fulfillment percentages of a plan from its totals.
+        :param totals:
+        :return:
+        """
+        return {
+            "expected_demand": round(totals["expected_demand"]),
+            "num_of_existing_to_deploy": round(totals["existing"]),
+            "num_of_new_to_deploy": round(totals["new"]),
+            "hiring_cost": round(totals["hiring_cost"], 2),
+            "current_fulfillment": round(
+                100 * float(safe_divide(totals["fulfillment_with_current"], totals["expected_demand"])), 2
+            ),
+            "project_fulfillment": round(
+                100 * float(safe_divide(totals["fulfillment_with_total"], totals["expected_demand"])), 2
+            ),
+        }
+
+
+atexit.register(PortfolioController.shutdown_process_pool)
+
+
+class CalculationJobController:
+    """
+    This controller is used to run manpower calculations as background jobs on the worker queue.
+    """
+
+    JOB_KIND = "calculate_manpower"
+
+    @classmethod
+    def add_calculation_job(cls, requirement_data: dict) -> str:
+        """
+        Queue a manpower calculation and return its job id.
         :param requirement_data:
         :return:
         """
-        category_name_to_id_mapping = Category.category_name_to_id_mapping()
-        dummy_output = {}
-        for date in requirement_data["expected_demand"]:
-            if date == "extra" or date == "total":
-                continue
-            if date not in dummy_output:
-                dummy_output[date] = dict()
-            for category in requirement_data["expected_demand"][date]:
-                if category == "total":
-                    dummy_output[date][category] = {
-                        "expected_demand": requirement_data["expected_demand"][date][category],
-                        "fulfillment_with_current": int(requirement_data["expected_demand"][date][category] * random()),
-                        "fulfillment_with_total": requirement_data["expected_demand"][date][category]
-                        + randint(-250, 250),
-                    }
-                else:
-                    dummy_output[date][category] = {
-                        "expected_demand": requirement_data["expected_demand"][date][category]["demand"],
-                        "fulfillment_with_current": int(
-                            requirement_data["expected_demand"][date][category]["demand"] * random()
-                        ),
-                        "fulfillment_with_total": requirement_data["expected_demand"][date][category]["demand"]
-                        + randint(-50, 60),
-                        "category_id": category_name_to_id_mapping[category],
-                    }
-
-        return dummy_output
+        return enqueue_job(cls.JOB_KIND, RequirementValidator().dump(requirement_data))
+
+    @classmethod
+    def get_calculation_job(cls, job_id: str) -> dict or None:
+        """
+        Get the status of a calculation job, with the result once it is finished.
+        :param job_id:
+        :return:
+        """
+        job = get_job(job_id)
+        return job if job and job["kind"] == cls.JOB_KIND else None
+
+    @staticmethod
+    def run_calculation_job(job_id: str, payload: dict) -> dict:
+        """
+        Run a queued calculation, this is called by the worker.
+        :param job_id:
+        :param payload:
+        :return:
+        """
+        return ResultController.calculate_manpower(RequirementValidator().load(payload))
+
+
+register_job_handler(CalculationJobController.JOB_KIND, CalculationJobController.run_calculation_job)
+
+
+class FileImportJobController:
+    """
+    This controller is used to import uploaded demand and productivity files as background jobs on the worker queue.
+    The file is stored in IMPORT_FILE_DIR until a worker imports it, and the job reports its progress.
+    """
+
+    DEMAND_JOB_KIND = "import_demand_file"
+    PRODUCTIVITY_JOB_KIND = "import_productivity_file"
+    # Number of errors kept in the progress of a job, the job result has all of them.
+    MAX_PROGRESS_ERRORS = 100
+
+    @classmethod
+    def add_import_job(cls, kind: str, file: FileStorage, payload: dict) -> str:
+        """
+        Store an uploaded file and queue its import, return the job id.
+        :param kind:
+        :param file:
+        :param payload: the arguments of the import besides the file.
+        :return:
+        """
+        import_file_dir = current_app.config["IMPORT_FILE_DIR"]
+        os.makedirs(import_file_dir, exist_ok=True)
+        path = os.path.join(import_file_dir, uuid.uuid4().hex + os.path.splitext(file.filename)[1])
+        file.save(path)
+        return enqueue_job(kind, {**payload, "path": path, "filename": file.filename})
+
+    @classmethod
+    def get_import_job(cls, job_id: str) -> dict or None:
+        """
+        Get the status and the progress of an import job, with the result once it is finished.
+        :param job_id:
+        :return:
+        """
+        job = get_job(job_id)
+        if not job or job["kind"] not in (cls.DEMAND_JOB_KIND, cls.PRODUCTIVITY_JOB_KIND):
+            return None
+        job["rows_processed"] = int(job.get("rows_processed", 0))
+        job["num_errors"] = int(job.get("num_errors", 0))
+        job["errors"] = json.loads(job.get("errors", "[]"))
+        return job
+
+    @classmethod
+    def run_import_job(cls, job_id: str, payload: dict, import_file) -> dict:
+        """
+        Import a stored file with import_file and delete it, this is called by the worker.
+        :param job_id:
+        :param payload:
+        :param import_file: function called with the file, the payload as keyword arguments and progress.
+        :return:
+        """
+
+        def progress(rows_processed: int, errors: list):
+            update_job(
+                job_id,
+                rows_processed=rows_processed,
+                num_errors=len(errors),
+                errors=json.dumps(errors[: cls.MAX_PROGRESS_ERRORS]),
+            )
+
+        path = payload.pop("path")
+        try:
+            with open(path, "rb") as stream:
+                error = import_file(FileStorage(stream, filename=payload.pop("filename")), progress=progress, **payload)
+        finally:
+            os.remove(path)
+
+        if isinstance(error, str):
+            # An error of the whole file is found before any row is processed.
+            progress(0, [error])
+        return {"error": error} if error else {"status": "success"}
+
+    @classmethod
+    def run_demand_import_job(cls, job_id: str, payload: dict) -> dict:
+        """
+        Run a queued demand file import, this is called by the worker.
+        :param job_id:
+        :param payload:
+        :return:
+        """
+        return cls.run_import_job(job_id, payload, DemandController.import_demand_file)
+
+    @classmethod
+    def run_productivity_import_job(cls, job_id: str, payload: dict) -> dict:
+        """
+        Run a queued productivity file import, this is called by the worker.
+        :param job_id:
+        :param payload:
+        :return:
+        """
+        return cls.run_import_job(job_id, payload, BenchmarkProductivityController.import_productivity_file)
+
+
+register_job_handler(FileImportJobController.DEMAND_JOB_KIND, FileImportJobController.run_demand_import_job)
+register_job_handler(FileImportJobController.PRODUCTIVITY_JOB_KIND, FileImportJobController.run_productivity_import_job)
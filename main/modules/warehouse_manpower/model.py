@@ -1,3 +1,4 @@
+from main.cache import redis_client
 from main.db import BaseModel, db
 
 
@@ -10,6 +11,20 @@ class Warehouse(BaseModel):
 
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.String(100), unique=False, nullable=True)
+    # Incremented on every change of the demand / benchmark productivity of the warehouse.
+    demand_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    productivity_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    def serialize(self) -> dict:
+        """
+        Override serialize function to leave out the internal version counters
+        :return:
+        """
+        return {
+            c.name: getattr(self, c.name)
+            for c in self.__table__.columns
+            if c.name not in ("demand_version", "productivity_version")
+        }
 
 
 class Category(BaseModel):
@@ -22,17 +37,78 @@ class Category(BaseModel):
     name = db.Column(db.String(100), unique=True)
     description = db.Column(db.String(100), unique=False, nullable=True)
 
+    # Redis key of the version of the categories, incremented on every write so that the mappings cached by every
+    # process are reloaded.
+    VERSION_KEY = "wmp:category_version"
+    # (version, id to name mapping, name to id mapping) cached by this process.
+    _mappings = None
+
+    @classmethod
+    def create(cls, data: dict) -> db.Model:
+        record = super().create(data)
+        cls.invalidate_mappings()
+        return record
+
+    def update(self, data: dict):
+        super().update(data)
+        self.invalidate_mappings()
+
+    @classmethod
+    def delete(cls, **filters):
+        super().delete(**filters)
+        cls.invalidate_mappings()
+
+    @classmethod
+    def write_many(cls, *args, **kwargs) -> tuple[list, list]:
+        result = super().write_many(*args, **kwargs)
+        cls.invalidate_mappings()
+        return result
+
+    @staticmethod
+    def invalidate_mappings():
+        """
+        Invalidate the cached category mappings of every process.
+        :return:
+        """
+        redis_client.incr(Category.VERSION_KEY)
+
+    @classmethod
+    def get_version(cls) -> str:
+        """
+        Get the version of the categories, which changes whenever they change.
+        :return:
+        """
+        return redis_client.get(cls.VERSION_KEY) or "0"
+
+    @classmethod
+    def get_mappings(cls) -> tuple[dict, dict]:
+        """
+        Get the id to name and the name to id mappings of the categories, which are cached until the categories
+        change. Only the version is read from Redis when the mappings are cached.
+        :return:
+        """
+        # The version is read before the categories, so that a write during the query is seen on the next call.
+        version = redis_client.get(cls.VERSION_KEY)
+        if cls._mappings is None or cls._mappings[0] != version:
+            records = db.session.query(cls.id, cls.name).all()
+            cls._mappings = (
+                version,
+                {record.id: record.name for record in records},
+                {record.name: record.id for record in records},
+            )
+        return cls._mappings[1], cls._mappings[2]
+
     @classmethod
     def category_id_to_name_mapping(cls):
         """
         Category id to name mapping
         :return:
         """
-        return {record.id: record.name for record in Category.query.all()}
+        return dict(cls.get_mappings()[0])
 
     @classmethod
     def category_name_to_id_mapping(cls):
-        return {record.name: record.id for record in Category.query.all()}
+        return dict(cls.get_mappings()[1])
 
     @classmethod
     def get_category_by_id(cls, category_id: int):
@@ -84,6 +160,23 @@ class InputDemand(BaseModel):
     __table_args__ = (db.UniqueConstraint(warehouse_id, category_id, date),)
 
 
+class DemandFileUpload(BaseModel):
+    """
+    Hash of the last demand file imported for a warehouse and date range, with the demand version of the warehouse
+    after the import. The same file is not imported again while the demands of the warehouse are unchanged.
+    """
+
+    __tablename__ = "demand_file_upload"
+
+    warehouse_id = db.Column(db.ForeignKey("warehouse.id"), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    file_hash = db.Column(db.String(64), nullable=False)
+    demand_version = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint(warehouse_id, start_date, end_date),)
+
+
 class InputRequirements(BaseModel):
     """
     Input Requirement Model.
@@ -101,3 +194,22 @@ class InputRequirements(BaseModel):
     created_by = db.Column(db.ForeignKey("auth_user.id"))
     updated_by = db.Column(db.ForeignKey("auth_user.id"), default=None)
     soft_delete_flag = db.Column(db.Integer)
+
+
+class CalculationResult(BaseModel):
+    """
+    Stored output of a manpower calculation, looked up by the fingerprint of its inputs. There is one per
+    requirement.
+    """
+
+    __tablename__ = "calculation_result"
+
+    warehouse_id = db.Column(db.ForeignKey("warehouse.id"), nullable=False)
+    requirement_id = db.Column(db.ForeignKey("input_requirements.id"), nullable=False)
+    fingerprint = db.Column(db.String(64), unique=True, nullable=False)
+    demand_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    result = db.Column(db.Text(length=2**32 - 1), nullable=False)
+    # Solved arrays of the requirement (see solver.dump_state), used to recalculate it incrementally.
+    state = db.Column(db.LargeBinary(length=2**32 - 1), nullable=True)
+
+    __table_args__ = (db.UniqueConstraint(requirement_id),)
@@ -1,5 +1,5 @@
-from marshmallow import Schema, fields
-from marshmallow.validate import Range
+from marshmallow import Schema, ValidationError, fields, validates_schema
+from marshmallow.validate import Length, Range
 
 from main.utils import greater_or_equal_to_current_date
 
@@ -58,12 +58,66 @@ class UpdateDemandValidator(Schema):
     demands = fields.List(fields.Nested(UpdateOnlyFieldDemand()), required=True)
 
 
-class RequirementValidator(Schema):
-    warehouse_id = fields.Integer(required=True)
-    num_current_employees = fields.Integer(required=True)
+class PlanDatesValidator(Schema):
     plan_from_date = fields.Date(required=True, validate=greater_or_equal_to_current_date)
     plan_to_date = fields.Date(required=True, validate=greater_or_equal_to_current_date)
-    percentage_absent_expected = fields.Integer(required=True)
+
+    @validates_schema
+    def validate_plan_dates(self, data, **kwargs):
+        if "plan_from_date" in data and "plan_to_date" in data and data["plan_from_date"] > data["plan_to_date"]:
+            raise ValidationError("plan_from_date should not be after plan_to_date.", "plan_to_date")
+
+
+class RequirementValidator(PlanDatesValidator):
+    warehouse_id = fields.Integer(required=True)
+    num_current_employees = fields.Integer(required=True, validate=Range(min=0))
+    percentage_absent_expected = fields.Integer(required=True, validate=Range(min=0, max=100))
     day_working_hours = fields.Integer(required=True, validate=Range(min=1, max=24))
     cost_per_employee_per_month = fields.Integer(required=True)
     total_hiring_budget = fields.Integer(required=True)
+
+
+class ScenarioValidator(PlanDatesValidator):
+    """
+    A requirement with lists of values to sweep, every combination of them is a scenario.
+    """
+
+    MAX_SCENARIOS = 1000
+
+    warehouse_id = fields.Integer(required=True)
+    num_current_employees = fields.Integer(required=True, validate=Range(min=0))
+    cost_per_employee_per_month = fields.Integer(required=True)
+    percentage_absent_expected = fields.List(
+        fields.Integer(validate=Range(min=0, max=100)), required=True, validate=Length(min=1)
+    )
+    day_working_hours = fields.List(
+        fields.Integer(validate=Range(min=1, max=24)), required=True, validate=Length(min=1)
+    )
+    total_hiring_budget = fields.List(fields.Integer(), required=True, validate=Length(min=1))
+
+    @validates_schema
+    def validate_number_of_scenarios(self, data, **kwargs):
+        num_scenarios = (
+            len(data.get("percentage_absent_expected", []))
+            * len(data.get("day_working_hours", []))
+            * len(data.get("total_hiring_budget", []))
+        )
+        if num_scenarios > self.MAX_SCENARIOS:
+            raise ValidationError(f"At most {self.MAX_SCENARIOS} scenarios are allowed, got {num_scenarios}.")
+
+
+class PortfolioValidator(PlanDatesValidator):
+    """
+    A requirement which is planned for every warehouse, or for the given warehouses only. The current employees and
+    the hiring budget are per warehouse, each warehouse is planned with all of them, so the hiring cost of the
+    network is at most the number of warehouses times the budget.
+    """
+
+    warehouse_ids = fields.List(fields.Integer(), required=False, validate=Length(min=1))
+    num_current_employees = fields.Integer(
+        required=True, validate=Range(min=0), data_key="num_current_employees_per_warehouse"
+    )
+    percentage_absent_expected = fields.Integer(required=True, validate=Range(min=0, max=100))
+    day_working_hours = fields.Integer(required=True, validate=Range(min=1, max=24))
+    cost_per_employee_per_month = fields.Integer(required=True)
+    total_hiring_budget = fields.Integer(required=True, data_key="hiring_budget_per_warehouse")
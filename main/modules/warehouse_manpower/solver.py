@@ -0,0 +1,465 @@
+import io
+from datetime import date, timedelta
+
+import numpy as np
+
+# Used to turn the monthly cost of an employee into the cost of one employee deployed for one day.
+DAYS_PER_MONTH = 30
+
+# Daily absenteeism is drawn from a Beta distribution around the expected percentage. The higher the concentration,
+# the closer the draws stay to the expected percentage.
+ABSENTEEISM_CONCENTRATION = 50
+NUM_ATTENDANCE_DRAWS = 10000
+RISK_PERCENTILES = (10, 50, 90)
+
+
+class PlanGrid:
+    """
+    Dense (date x category) view of the demand and the benchmark productivity of a warehouse. Row `i` of every
+    matrix is the date `start_date + i days` and column `j` is the category `category_ids[j]`.
+    """
+
+    def __init__(
+        self,
+        start_date,
+        category_ids: np.ndarray,
+        demand: np.ndarray,
+        mask: np.ndarray,
+        productivity_experienced: np.ndarray,
+        productivity_new: np.ndarray,
+    ):
+        self.start_date = start_date
+        self.category_ids = category_ids
+        self.demand = demand
+        self.mask = mask
+        self.productivity_experienced = productivity_experienced
+        self.productivity_new = productivity_new
+
+    @property
+    def dates(self) -> list:
+        return [self.start_date + timedelta(days=i) for i in range(self.demand.shape[0])]
+
+
+def build_plan_grid(start_date, end_date, demand_rows: list, productivity_rows: list) -> PlanGrid:
+    """
+    Build a PlanGrid from (date, category_id, demand) and (category_id, productivity_experienced_employee,
+    productivity_new_employee) rows. Only the categories that have demand in the date range become columns.
+    :param start_date:
+    :param end_date:
+    :param demand_rows:
+    :param productivity_rows:
+    :return:
+    """
+    num_days = max((end_date - start_date).days + 1, 0)
+    if demand_rows:
+        dates, categories, demands = zip(*demand_rows)
+    else:
+        dates, categories, demands = (), (), ()
+
+    day_index = (np.array(dates, dtype="datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64)
+    category_ids, category_index = np.unique(np.array(categories, dtype=np.int64), return_inverse=True)
+
+    demand = np.zeros((num_days, len(category_ids)))
+    mask = np.zeros((num_days, len(category_ids)), dtype=bool)
+    demand[day_index, category_index] = demands
+    mask[day_index, category_index] = True
+
+    productivity_experienced = np.zeros(len(category_ids))
+    productivity_new = np.zeros(len(category_ids))
+    if productivity_rows and len(category_ids):
+        productivity_categories, experienced, new = (np.array(column) for column in zip(*productivity_rows))
+        position = np.searchsorted(category_ids, productivity_categories).clip(max=len(category_ids) - 1)
+        known = category_ids[position] == productivity_categories
+        productivity_experienced[position[known]] = experienced[known]
+        productivity_new[position[known]] = new[known]
+
+    return PlanGrid(start_date, category_ids, demand, mask, productivity_experienced, productivity_new)
+
+
+def dump_state(grid: PlanGrid, solution: dict) -> bytes:
+    """
+    Serialize a solved grid, so that it can be stored and re-solved incrementally later.
+    :param grid:
+    :param solution:
+    :return:
+    """
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        start_date=np.array(grid.start_date.toordinal()),
+        category_ids=grid.category_ids,
+        demand=grid.demand,
+        mask=grid.mask,
+        productivity_experienced=grid.productivity_experienced,
+        productivity_new=grid.productivity_new,
+        **{f"solution_{key}": value for key, value in solution.items()},
+    )
+    return buffer.getvalue()
+
+
+def load_state(state: bytes) -> tuple:
+    """
+    Load a solved grid stored by `dump_state`.
+    :param state:
+    :return: grid and solution
+    """
+    arrays = np.load(io.BytesIO(state))
+    grid = PlanGrid(
+        date.fromordinal(int(arrays["start_date"])),
+        arrays["category_ids"],
+        arrays["demand"],
+        arrays["mask"],
+        arrays["productivity_experienced"],
+        arrays["productivity_new"],
+    )
+    solution = {key[len("solution_") :]: arrays[key] for key in arrays.files if key.startswith("solution_")}
+    return grid, solution
+
+
+def safe_divide(numerator, denominator) -> np.ndarray:
+    """
+    Element-wise division which returns 0 wherever the denominator is not positive.
+    :param numerator:
+    :param denominator:
+    :return:
+    """
+    numerator, denominator = np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    out = np.zeros(np.broadcast_shapes(numerator.shape, denominator.shape))
+    return np.divide(numerator, denominator, out=out, where=denominator > 0)
+
+
+def allocate_new_employees(residual: np.ndarray, capacity: np.ndarray, max_new_employees) -> np.ndarray:
+    """
+    Allocate at most `max_new_employees` new employee-days across the (date, category) cells so that the fulfilled
+    demand is maximum.
+
+    Every employee-day costs the same, so taking the hires with the largest marginal gain first is optimal. Each
+    cell offers floor(residual / capacity) hires which gain the full capacity and at most one more hire which gains
+    the remainder. All the offers are ranked with one stable sort (earlier dates win ties) and taken until the
+    limit is reached.
+    :param residual: demand left after the existing employees, (..., date, category).
+    :param capacity: units delivered by one deployed new employee in a day, (..., 1, category).
+    :param max_new_employees: scalar or (..., 1, 1) array.
+    :return:
+    """
+    shape = np.broadcast_shapes(np.shape(residual), np.shape(capacity), np.shape(max_new_employees))
+    residual, capacity = np.broadcast_to(residual, shape), np.broadcast_to(capacity, shape)
+    full = np.floor(safe_divide(residual, capacity))
+    remainder = np.where(capacity > 0, residual - full * capacity, 0)
+
+    flat_shape = shape[:-2] + (-1,)
+    gains = np.concatenate(
+        [np.where(full > 0, capacity, 0).reshape(flat_shape), remainder.reshape(flat_shape)], axis=-1
+    )
+    counts = np.concatenate([full.reshape(flat_shape), (remainder > 0).reshape(flat_shape)], axis=-1)
+    limit = np.asarray(max_new_employees, dtype=float)
+    limit = limit.reshape(limit.shape[:-1]) if limit.ndim >= 2 else limit
+    if np.all(limit >= counts.sum(axis=-1, keepdims=True)):
+        # The budget covers every hire, no need to rank them.
+        return full + (remainder > 0)
+
+    order = np.argsort(-gains, axis=-1, kind="stable")
+    sorted_counts = np.take_along_axis(counts, order, axis=-1)
+    taken_before = np.cumsum(sorted_counts, axis=-1) - sorted_counts
+    taken = np.empty_like(sorted_counts)
+    np.put_along_axis(taken, order, np.clip(limit - taken_before, 0, sorted_counts), axis=-1)
+
+    cells = taken.shape[-1] // 2
+    return (taken[..., :cells] + taken[..., cells:]).reshape(shape)
+
+
+def solve_existing(
+    demand: np.ndarray,
+    productivity_experienced: np.ndarray,
+    num_current_employees,
+    percentage_absent_expected,
+    day_working_hours,
+) -> tuple:
+    """
+    Deploy the existing employees who are expected to be present. When a day needs more of them than are
+    available, they are split across the categories in proportion to what each category needs. Every date is
+    solved on its own.
+    :param demand:
+    :param productivity_experienced:
+    :param num_current_employees:
+    :param percentage_absent_expected:
+    :param day_working_hours:
+    :return: existing employees and the demand they fulfill.
+    """
+    attendance = 1 - np.asarray(percentage_absent_expected, dtype=float) / 100
+    capacity_experienced = productivity_experienced * np.asarray(day_working_hours, dtype=float)
+
+    required_existing = np.ceil(safe_divide(demand, capacity_experienced))
+    available_existing = np.floor(np.asarray(num_current_employees, dtype=float) * attendance)
+    share = np.minimum(1, safe_divide(available_existing, required_existing.sum(axis=-1, keepdims=True)))
+    existing = np.floor(required_existing * share)
+    return existing.astype(np.int64), np.minimum(demand, existing * capacity_experienced)
+
+
+def solve_new(
+    demand: np.ndarray,
+    fulfillment_with_current: np.ndarray,
+    productivity_new: np.ndarray,
+    percentage_absent_expected,
+    day_working_hours,
+    total_hiring_budget=None,
+    cost_per_employee_per_month=None,
+) -> tuple:
+    """
+    Cover the demand left by the existing employees with new employees, grossed up for the expected
+    absenteeism. When a hiring budget is given, the new employees are allocated by `allocate_new_employees`
+    within that budget, which couples every cell of the plan.
+    :param demand:
+    :param fulfillment_with_current:
+    :param productivity_new:
+    :param percentage_absent_expected:
+    :param day_working_hours:
+    :param total_hiring_budget:
+    :param cost_per_employee_per_month:
+    :return: new employees and the demand fulfilled with the existing and the new employees.
+    """
+    attendance = 1 - np.asarray(percentage_absent_expected, dtype=float) / 100
+    capacity_new = productivity_new * np.asarray(day_working_hours, dtype=float) * attendance
+
+    residual = demand - fulfillment_with_current
+    if total_hiring_budget is None:
+        new = np.ceil(safe_divide(residual, capacity_new))
+    else:
+        cost_per_employee_per_day = get_cost_per_employee_per_day(cost_per_employee_per_month)
+        max_new_employees = np.where(
+            cost_per_employee_per_day > 0,
+            np.floor(safe_divide(total_hiring_budget, cost_per_employee_per_day)),
+            np.inf,
+        )
+        new = allocate_new_employees(residual, capacity_new, max_new_employees)
+    return new.astype(np.int64), np.minimum(demand, fulfillment_with_current + new * capacity_new)
+
+
+def get_cost_per_employee_per_day(cost_per_employee_per_month) -> np.ndarray:
+    if cost_per_employee_per_month is None:
+        cost_per_employee_per_month = 0
+    return np.asarray(cost_per_employee_per_month, dtype=float) / DAYS_PER_MONTH
+
+
+def get_hiring_cost(new: np.ndarray, cost_per_employee_per_month) -> np.ndarray:
+    """
+    Cost of the new employee-days of a plan, one value per scenario.
+    :param new:
+    :param cost_per_employee_per_month:
+    :return:
+    """
+    cost_per_employee_per_day = get_cost_per_employee_per_day(cost_per_employee_per_month)
+    return (new.sum(axis=(-2, -1), keepdims=True) * cost_per_employee_per_day)[..., 0, 0]
+
+
+def solve_headcount(
+    demand: np.ndarray,
+    productivity_experienced: np.ndarray,
+    productivity_new: np.ndarray,
+    num_current_employees,
+    percentage_absent_expected,
+    day_working_hours,
+    total_hiring_budget=None,
+    cost_per_employee_per_month=None,
+) -> dict:
+    """
+    Compute the number of existing and new employees to deploy for every (date, category) cell in one pass, see
+    `solve_existing` and `solve_new`.
+
+    The requirement parameters may be scalars or arrays of shape (..., 1, 1), in which case every scenario is
+    solved at once and the results get the matching leading axes.
+    :param demand: (date, category) matrix.
+    :param productivity_experienced: units per hour of an experienced employee, one per category.
+    :param productivity_new: units per hour of a new employee, one per category.
+    :param num_current_employees:
+    :param percentage_absent_expected:
+    :param day_working_hours:
+    :param total_hiring_budget:
+    :param cost_per_employee_per_month:
+    :return:
+    """
+    existing, fulfillment_with_current = solve_existing(
+        demand, productivity_experienced, num_current_employees, percentage_absent_expected, day_working_hours
+    )
+    new, fulfillment_with_total = solve_new(
+        demand,
+        fulfillment_with_current,
+        productivity_new,
+        percentage_absent_expected,
+        day_working_hours,
+        total_hiring_budget,
+        cost_per_employee_per_month,
+    )
+    return {
+        "existing": existing,
+        "new": new,
+        "fulfillment_with_current": fulfillment_with_current,
+        "fulfillment_with_total": fulfillment_with_total,
+        "hiring_cost": get_hiring_cost(new, cost_per_employee_per_month),
+    }
+
+
+def solve_dates(
+    grid: PlanGrid,
+    solution: dict,
+    rows: np.ndarray,
+    num_current_employees,
+    percentage_absent_expected,
+    day_working_hours,
+    total_hiring_budget=None,
+    cost_per_employee_per_month=None,
+) -> dict:
+    """
+    Re-solve the given date rows of an already solved grid after their demand changed, the solution of the other
+    dates is reused. Only the budgeted allocation of new employees, which is cheap, runs on the whole grid.
+    :param grid:
+    :param solution:
+    :param rows: indices of the dates whose demand changed.
+    :param num_current_employees:
+    :param percentage_absent_expected:
+    :param day_working_hours:
+    :param total_hiring_budget:
+    :param cost_per_employee_per_month:
+    :return: a new solution, the given one is not modified.
+    """
+    solution = {key: value.copy() for key, value in solution.items()}
+    solution["existing"][rows], solution["fulfillment_with_current"][rows] = solve_existing(
+        grid.demand[rows],
+        grid.productivity_experienced,
+        num_current_employees,
+        percentage_absent_expected,
+        day_working_hours,
+    )
+    if total_hiring_budget is None:
+        solution["new"][rows], solution["fulfillment_with_total"][rows] = solve_new(
+            grid.demand[rows],
+            solution["fulfillment_with_current"][rows],
+            grid.productivity_new,
+            percentage_absent_expected,
+            day_working_hours,
+        )
+    else:
+        solution["new"], solution["fulfillment_with_total"] = solve_new(
+            grid.demand,
+            solution["fulfillment_with_current"],
+            grid.productivity_new,
+            percentage_absent_expected,
+            day_working_hours,
+            total_hiring_budget,
+            cost_per_employee_per_month,
+        )
+    solution["hiring_cost"] = get_hiring_cost(solution["new"], cost_per_employee_per_month)
+    return solution
+
+
+def solve_scenarios(
+    grid: PlanGrid,
+    num_current_employees,
+    percentage_absent_expected,
+    day_working_hours,
+    total_hiring_budget,
+    cost_per_employee_per_month,
+    max_cells: int = 2**22,
+) -> dict:
+    """
+    Solve many variants of a requirement on the same grid. Every parameter is a scalar or a 1-D array with one
+    value per scenario. The scenarios are solved as broadcasted arrays, in chunks of at most `max_cells`
+    (scenario, date, category) cells to bound the memory.
+    :param grid:
+    :param num_current_employees:
+    :param percentage_absent_expected:
+    :param day_working_hours:
+    :param total_hiring_budget:
+    :param cost_per_employee_per_month:
+    :param max_cells:
+    :return: plan totals, one value per scenario.
+    """
+    parameters = np.broadcast_arrays(
+        *(
+            np.atleast_1d(np.asarray(parameter, dtype=float))
+            for parameter in (
+                num_current_employees,
+                percentage_absent_expected,
+                day_working_hours,
+                total_hiring_budget,
+                cost_per_employee_per_month,
+            )
+        )
+    )
+    num_scenarios = len(parameters[0])
+    chunk_size = max(1, max_cells // max(grid.demand.size, 1))
+    keys = ("existing", "new", "fulfillment_with_current", "fulfillment_with_total", "hiring_cost")
+    totals = {key: np.zeros(num_scenarios) for key in keys}
+    for start in range(0, num_scenarios, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        solution = solve_headcount(
+            grid.demand,
+            grid.productivity_experienced,
+            grid.productivity_new,
+            *(parameter[chunk].reshape(-1, 1, 1) for parameter in parameters),
+        )
+        for key, total in totals.items():
+            total[chunk] = solution[key] if key == "hiring_cost" else solution[key].sum(axis=(-2, -1))
+    return totals
+
+
+def simulate_attendance(
+    num_days: int,
+    percentage_absent_expected,
+    num_draws: int = NUM_ATTENDANCE_DRAWS,
+    percentiles: tuple = RISK_PERCENTILES,
+    seed=None,
+) -> np.ndarray:
+    """
+    Monte Carlo simulation of the share of employees present on every day of a plan. The absenteeism of each day
+    is drawn independently from a Beta distribution whose mean is `percentage_absent_expected`.
+    :param num_days:
+    :param percentage_absent_expected:
+    :param num_draws:
+    :param percentiles:
+    :param seed:
+    :return: (percentile, date) matrix of attendance.
+    """
+    mean_absence = float(percentage_absent_expected) / 100
+    if mean_absence <= 0 or mean_absence >= 1:
+        return np.full((len(percentiles), num_days), 1 - min(max(mean_absence, 0), 1))
+
+    rng = np.random.default_rng(seed)
+    absence = rng.beta(
+        mean_absence * ABSENTEEISM_CONCENTRATION,
+        (1 - mean_absence) * ABSENTEEISM_CONCENTRATION,
+        size=(num_draws, num_days),
+    )
+    return np.percentile(1 - absence, percentiles, axis=0, method="inverted_cdf")
+
+
+def get_fulfillment_bands(
+    demand: np.ndarray,
+    solution: dict,
+    productivity_experienced: np.ndarray,
+    productivity_new: np.ndarray,
+    attendance_percentiles: np.ndarray,
+    percentage_absent_expected,
+    day_working_hours,
+) -> np.ndarray:
+    """
+    Demand fulfilled by the planned employees when only a share of them is present. The employees of a solution
+    are planned for the expected attendance, so the capacity they deliver scales with the attendance of the day.
+    As the fulfillment only grows with the attendance, the percentiles of the fulfillment are the fulfillment at
+    the percentiles of the attendance given by `simulate_attendance`.
+    :param demand:
+    :param solution:
+    :param productivity_experienced:
+    :param productivity_new:
+    :param attendance_percentiles: (percentile, date) matrix.
+    :param percentage_absent_expected:
+    :param day_working_hours:
+    :return: (percentile, date, category) matrix.
+    """
+    expected_attendance = 1 - np.asarray(percentage_absent_expected, dtype=float) / 100
+    hours = np.asarray(day_working_hours, dtype=float)
+    capacity = (
+        safe_divide(solution["existing"] * productivity_experienced * hours, expected_attendance)
+        + solution["new"] * productivity_new * hours
+    )
+    return np.minimum(demand, capacity * attendance_percentiles[:, :, None])
@@ -1,28 +1,42 @@
-import json
-
-import pandas as pd
 from flask import jsonify, make_response, request
 from flask_jwt_extended import jwt_required
 from flask_restx import Namespace, Resource
 
+from main.cache import CacheResource
 from main.modules.warehouse_manpower.controller import (
     BenchmarkProductivityController,
-    CategoryController,
+    CalculationJobController,
     DemandController,
+    FileImportJobController,
+    PortfolioController,
     ResultController,
+    ScenarioController,
     WarehouseController,
 )
 from main.modules.warehouse_manpower.schema_validator import (
     BulkWarehouseValidator,
+    PortfolioValidator,
     RequirementValidator,
+    ScenarioValidator,
     UpdateBenchmarkProductivityValidator,
     UpdateDemandValidator,
 )
-from main.utils import get_data_from_request_or_raise_validation_error
+from main.utils import (
+    EXCEL_MIMETYPE,
+    EXPORT_FORMATS,
+    SUPPORTED_FILE_EXTENSIONS,
+    get_data_from_request_or_raise_validation_error,
+    is_columnar_format_requested,
+    make_columnar_response,
+    make_export_response,
+    make_file_response,
+)
 
 
-class Warehouses(Resource):
+class Warehouses(CacheResource):
     # method_decorators = [jwt_required()]
+    cache_tags = (WarehouseController.WAREHOUSES_CACHE_TAG,)
+    cache_by_user_role = False
 
     def get(self):
         warehouses = WarehouseController.get_warehouses()
@@ -34,8 +48,13 @@ class Warehouses(Resource):
         return make_response(jsonify(warehouses=created_warehouses, error_data=error_data), 201)
 
 
-class WarehouseBenchmarkProductivity(Resource):
+class WarehouseBenchmarkProductivity(CacheResource):
     # method_decorators = [jwt_required()]
+    cache_tags = (WarehouseController.PRODUCTIVITY_CACHE_TAG,)
+    cache_by_user_role = False
+
+    def get_data_version(self, warehouse_id: int) -> str or None:
+        return WarehouseController.get_data_version(warehouse_id, "productivity_version")
 
     def get(self, warehouse_id: int):
         benchmark_productivity = BenchmarkProductivityController.get_benchmark_productivity_by_warehouse_id(
@@ -53,14 +72,21 @@ class BenchmarkProductivity(Resource):
         return make_response(jsonify(status="success"), 200)
 
 
-class WarehouseDemands(Resource):
+class WarehouseDemands(CacheResource):
     # method_decorators = [jwt_required()]
+    cache_tags = (WarehouseController.DEMANDS_CACHE_TAG,)
+    cache_by_user_role = False
+
+    def get_data_version(self, warehouse_id: int) -> str or None:
+        return WarehouseController.get_data_version(warehouse_id, "demand_version")
 
     def get(self, warehouse_id: int):
         start_date, end_date = request.args.get("start_date"), request.args.get("end_date")
         if not start_date or not end_date:
             return make_response(jsonify(error="start_date and end_date are required parameters"), 400)
         demands = DemandController.get_demands_by_warehouse_id(warehouse_id, start_date, end_date)
+        if is_columnar_format_requested():
+            return make_columnar_response(DemandController.get_columnar_demands(demands))
         return make_response(jsonify(demands), 200)
 
 
@@ -78,10 +104,52 @@ class CalculateManpower(Resource):
 
     def post(self):
         data = get_data_from_request_or_raise_validation_error(RequirementValidator, request.json)
+        if request.args.get("mode") == "async":
+            job_id = CalculationJobController.add_calculation_job(data)
+            return make_response(jsonify(job_id=job_id, status="queued"), 202)
         result = ResultController.calculate_manpower(data)
+        if is_columnar_format_requested():
+            return make_columnar_response(ResultController.get_columnar_result(result))
         return make_response(jsonify(result), 200)
 
 
+class RequirementDemands(Resource):
+    # method_decorators = [jwt_required()]
+
+    def put(self, requirement_id: int):
+        data = get_data_from_request_or_raise_validation_error(UpdateDemandValidator, request.json)
+        result = ResultController.recalculate_manpower(requirement_id, data["demands"])
+        if is_columnar_format_requested():
+            return make_columnar_response(ResultController.get_columnar_result(result))
+        return make_response(jsonify(result), 200)
+
+
+class CalculationJob(Resource):
+    # method_decorators = [jwt_required()]
+
+    def get(self, job_id: str):
+        job = CalculationJobController.get_calculation_job(job_id)
+        if not job:
+            return make_response(jsonify(error=f"Calculation job not found with id {job_id}"), 404)
+        return make_response(jsonify(job), 200)
+
+
+class Scenarios(Resource):
+    # method_decorators = [jwt_required()]
+
+    def post(self):
+        data = get_data_from_request_or_raise_validation_error(ScenarioValidator, request.json)
+        return make_response(jsonify(ScenarioController.compare_scenarios(data)), 200)
+
+
+class Portfolio(Resource):
+    # method_decorators = [jwt_required()]
+
+    def post(self):
+        data = get_data_from_request_or_raise_validation_error(PortfolioValidator, request.json)
+        return make_response(jsonify(PortfolioController.plan_portfolio(data)), 200)
+
+
 class ProductivityFile(Resource):
     # method_decorators = [jwt_required()]
 
@@ -94,28 +162,18 @@ class ProductivityFile(Resource):
 
         file = request.files["file"]
 
-        if not file.filename.endswith(".xls") and not file.filename.endswith(".xlsx"):
+        if not file.filename.endswith(SUPPORTED_FILE_EXTENSIONS):
             return make_response(jsonify({"error": "Invalid file extension."}), 400)
 
-        df = pd.read_excel(file)
-
-        required_columns = ["category", "productivity_experienced_employee", "productivity_new_employee"]
-        missing_columns = set(required_columns) - set(df.columns)
-        extra_columns = set(df.columns) - set(required_columns)
-        if missing_columns:
-            return make_response(jsonify({"error": f"Missing columns: {missing_columns}."}), 400)
-        elif extra_columns:
-            return make_response(jsonify({"error": f"Extra columns: {extra_columns}."}), 400)
+        if request.args.get("mode") == "async":
+            job_id = FileImportJobController.add_import_job(
+                FileImportJobController.PRODUCTIVITY_JOB_KIND, file, {"warehouse_id": warehouse_id}
+            )
+            return make_response(jsonify(import_id=job_id, status="queued"), 202)
 
-        data = df.to_json(orient="records")
-        data = json.loads(data)
-        category_data, error = CategoryController.convert_excel_file_data_according_to_category(data)
+        error = BenchmarkProductivityController.import_productivity_file(file, warehouse_id)
         if error:
             return make_response(jsonify(error=error), 400)
-
-        CategoryController.add_categories(category_data)
-        BenchmarkProductivityController.add_benchmark_category_from_excel_file_data(data, warehouse_id)
-
         return make_response(jsonify(status="success"), 201)
 
 
@@ -130,35 +188,94 @@ class DemandFile(Resource):
 
         file = request.files["file"]
 
-        if not file.filename.endswith(".xls") and not file.filename.endswith(".xlsx"):
+        if not file.filename.endswith(SUPPORTED_FILE_EXTENSIONS):
             return make_response(jsonify({"error": "Invalid file extension."}), 400)
 
-        df = pd.read_excel(file)
+        payload = {
+            "warehouse_id": warehouse_id,
+            "start_date": request.form.get("start_date"),
+            "end_date": request.form.get("end_date"),
+        }
+        if request.args.get("mode") == "async":
+            job_id = FileImportJobController.add_import_job(FileImportJobController.DEMAND_JOB_KIND, file, payload)
+            return make_response(jsonify(import_id=job_id, status="queued"), 202)
+
+        error = DemandController.import_demand_file(file, **payload)
+        if error:
+            return make_response(jsonify(error=error), 400)
+        return make_response(jsonify(status="success"), 201)
+
+
+class FileImport(Resource):
+    # method_decorators = [jwt_required()]
 
-        data = df.to_json(orient="records")
-        data = json.loads(data)
+    def get(self, import_id: str):
+        job = FileImportJobController.get_import_job(import_id)
+        if not job:
+            return make_response(jsonify(error=f"Import not found with id {import_id}"), 404)
+        return make_response(jsonify(job), 200)
 
-        if df.columns[0].lower() != "date":
-            return make_response(jsonify({"error": "Date column is missing"}), 400)
 
-        invalid_categories = CategoryController.check_invalid_categories(df.columns[1:])
-        if invalid_categories:
-            return make_response(jsonify({"error": f"Invalid categories : [{invalid_categories}]"}), 400)
+def get_export_format_error():
+    if request.args.get("format", "arrow") not in EXPORT_FORMATS:
+        return make_response(jsonify(error=f"format should be one of {list(EXPORT_FORMATS)}"), 400)
 
-        start_date = request.form.get("start_date")
-        end_date = request.form.get("end_date")
-        if not start_date or not end_date:
-            return make_response(
-                jsonify({"error": "start_date and end_date should be present in form data of requests"}), 400
-            )
 
-        converted_data, error = DemandController.check_and_convert_excel_data_according_to_input_demand(
-            start_date, end_date, data, warehouse_id
+class DemandExport(Resource):
+    # method_decorators = [jwt_required()]
+
+    def get(self, warehouse_id: int):
+        if error := get_export_format_error():
+            return error
+        batches = DemandController.export_demands(
+            warehouse_id, request.args.get("start_date"), request.args.get("end_date")
         )
-        if error:
-            return make_response(jsonify(error=error), 400)
-        DemandController.add_demands(converted_data)
-        return make_response(jsonify(status="success"), 201)
+        return make_export_response(
+            batches, DemandController.EXPORT_SCHEMA, request.args.get("format", "arrow"), f"demands_{warehouse_id}"
+        )
+
+
+class BenchmarkProductivityExport(Resource):
+    # method_decorators = [jwt_required()]
+
+    def get(self, warehouse_id: int):
+        if error := get_export_format_error():
+            return error
+        return make_export_response(
+            BenchmarkProductivityController.export_benchmark_productivity(warehouse_id),
+            BenchmarkProductivityController.EXPORT_SCHEMA,
+            request.args.get("format", "arrow"),
+            f"benchmark_productivity_{warehouse_id}",
+        )
+
+
+class ResultExport(Resource):
+    # method_decorators = [jwt_required()]
+
+    def get(self, requirement_id: int):
+        if error := get_export_format_error():
+            return error
+        table = ResultController.export_result(requirement_id)
+        if table is None:
+            return make_response(jsonify(error=f"Plan not found for requirement {requirement_id}"), 404)
+        return make_export_response(
+            table.to_batches(), table.schema, request.args.get("format", "arrow"), f"plan_{requirement_id}"
+        )
+
+
+class PlansExcelExport(Resource):
+    # method_decorators = [jwt_required()]
+
+    def get(self):
+        requirement_ids = list(dict.fromkeys(request.args.getlist("requirement_id", type=int)))
+        if not requirement_ids:
+            return make_response(jsonify(error="requirement_id is a required parameter"), 400)
+        warehouse_names = ResultController.get_plan_warehouse_names(requirement_ids)
+        missing_ids = [requirement_id for requirement_id in requirement_ids if requirement_id not in warehouse_names]
+        if missing_ids:
+            return make_response(jsonify(error=f"Plan not found for requirements {missing_ids}"), 404)
+        path = ResultController.export_plans_excel({key: warehouse_names[key] for key in requirement_ids})
+        return make_file_response(path, EXCEL_MIMETYPE, "plans.xlsx")
 
 
 #  wmp = warehouse manpower planner
@@ -170,5 +287,14 @@ wmp_namespace.add_resource(BenchmarkProductivity, "/benchmark_productivity")
 wmp_namespace.add_resource(WarehouseDemands, "/demands/<int:warehouse_id>")
 wmp_namespace.add_resource(Demands, "/demands")
 wmp_namespace.add_resource(CalculateManpower, "/calculate")
+wmp_namespace.add_resource(CalculationJob, "/calculate/<string:job_id>")
+wmp_namespace.add_resource(RequirementDemands, "/requirements/<int:requirement_id>/demands")
+wmp_namespace.add_resource(Scenarios, "/scenarios")
+wmp_namespace.add_resource(Portfolio, "/portfolio")
 wmp_namespace.add_resource(ProductivityFile, "/upload_productivity_file/<int:warehouse_id>")
 wmp_namespace.add_resource(DemandFile, "/demand_forecast_file/<int:warehouse_id>")
+wmp_namespace.add_resource(FileImport, "/imports/<string:import_id>")
+wmp_namespace.add_resource(DemandExport, "/export/demands/<int:warehouse_id>")
+wmp_namespace.add_resource(BenchmarkProductivityExport, "/export/benchmark_productivity/<int:warehouse_id>")
+wmp_namespace.add_resource(ResultExport, "/export/results/<int:requirement_id>")
+wmp_namespace.add_resource(PlansExcelExport, "/export/plans")
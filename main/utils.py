@@ -1,18 +1,39 @@
+import hashlib
+import io
 import operator
 import os
 from datetime import date, datetime
+from itertools import chain, islice
 
-from flask import request
+import msgpack
+import openpyxl
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import current_app, request, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from marshmallow import Schema, ValidationError, fields
 from marshmallow.validate import Length
-from sqlalchemy import between, or_
+from sqlalchemy import between, or_, tuple_
 
+from main.db import db
 from main.exceptions import CustomValidationError
 from main.logger import INFO, get_logger
 
 access_logger = get_logger("access", INFO)
 
+SUPPORTED_FILE_EXTENSIONS = (".xls", ".xlsx", ".csv", ".parquet")
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+# Mimetype and file extension of the export formats.
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+EXCEL_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Number of rows fetched from the database and written at a time by an export.
+EXPORT_BATCH_SIZE = 10000
+
 
 def validate_substr(v: str):
     """
@@ -111,12 +132,24 @@ def log_user_access(response):
         f"Path: {request.path}\n"
         f"Headers: {request.headers}"
         f"Request Payload: {request.get_data(as_text=True)}\n"
-        f"Response data: {response.get_data(as_text=True)}\n"
+        f"Response data: {get_response_text(response)}\n"
         f"Status code: {response.status_code}"
     )
     return response
 
 
+def get_response_text(response) -> str:
+    """
+    This function is used to get the body of a text or JSON response for the access log, binary and streamed
+    bodies are not read.
+    :param response:
+    :return:
+    """
+    if not response.is_streamed and (response.is_json or response.mimetype.startswith("text/")):
+        return response.get_data(as_text=True)
+    return f"<{response.mimetype} body>"
+
+
 def add_filters_using_mapping(model: type, conditions: dict, filters: list, operator_key: str):
     """
     This function is used to update the filters using input and operators mapping.
@@ -209,3 +242,316 @@ def greater_or_equal_to_current_date(input_date):
 
     today = date.today()
     return input_date >= today or os.environ.get("FLASK_ENV") == "test"  # This is the temp solution
+
+
+def iter_excel_rows(file):
+    """
+    Function to read the rows of the first sheet of an Excel file one by one, the first row is the header. An xlsx
+    file is streamed in read-only mode so that the whole sheet is never in memory, an xls file is read at once.
+    Empty cells are None and empty rows after the last row with data are skipped.
+    :param file:
+    :return:
+    """
+    if file.filename.endswith(".xls"):
+        df = pd.read_excel(file)
+        df = df.astype(object).where(df.notna(), None)
+        workbook = None
+        rows = iter([tuple(df.columns)] + list(df.itertuples(index=False, name=None)))
+    else:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+
+    try:
+        header = next(rows, None)
+        if header is None:
+            return
+        yield tuple(f"Unnamed: {i}" if name is None else name for i, name in enumerate(header))
+        num_empty_rows = 0
+        for row in rows:
+            if all(value is None for value in row):
+                num_empty_rows += 1
+                continue
+            for _ in range(num_empty_rows):
+                yield (None,) * len(header)
+            num_empty_rows = 0
+            yield row
+    finally:
+        if workbook:
+            workbook.close()
+
+
+def get_chunks(iterable, chunk_size: int):
+    """
+    Function to split an iterable in lists of chunk_size items, the last one can be shorter.
+    :param iterable:
+    :param chunk_size:
+    :return:
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def get_date(value) -> date | None:
+    """
+    Function to get the date of a date cell of a file, None when the cell is not a date.
+    :param value:
+    :return:
+    """
+    if isinstance(value, datetime):
+        return None if pd.isna(value) else value.date()
+    return value if isinstance(value, date) else None
+
+
+def get_file_hash(file) -> str:
+    """
+    Function to get the sha256 hash of the content of an uploaded file, the file is read again from its start after.
+    :param file:
+    :return:
+    """
+    file_hash = hashlib.sha256()
+    file.stream.seek(0)
+    for block in iter(lambda: file.stream.read(1 << 20), b""):
+        file_hash.update(block)
+    file.stream.seek(0)
+    return file_hash.hexdigest()
+
+
+def read_file(file) -> pd.DataFrame:
+    """
+    Function to read a whole xls, xlsx, csv or parquet file, the first row of an Excel or csv file is the header.
+    :param file:
+    :return:
+    """
+    if file.filename.endswith(".parquet"):
+        return pq.read_table(file.stream).to_pandas()
+    elif file.filename.endswith(".csv"):
+        return pd.read_csv(file.stream)
+    return pd.read_excel(file)
+
+
+def read_file_in_chunks(file, chunk_size: int) -> tuple[tuple, iter]:
+    """
+    Function to read an xls, xlsx, csv or parquet file in DataFrames of chunk_size rows, so that only one chunk of a
+    big file is in memory. The columns of the chunks are numbered from 0 and their missing cells are NaN or None.
+    A parquet file is read one record batch at a time, its numeric columns are converted without a copy. The dates
+    of the first column of a csv file are parsed, the cells which are not a date are kept as text.
+    :param file:
+    :param chunk_size:
+    :return: the header of the file and an iterator of its chunks.
+    """
+    if file.filename.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(file.stream)
+        header = tuple(parquet_file.schema_arrow.names)
+        chunks = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunk_size))
+    elif file.filename.endswith(".csv"):
+        try:
+            reader = pd.read_csv(file.stream, chunksize=chunk_size)
+        except pd.errors.EmptyDataError:
+            return (), iter(())
+        first_chunk = next(reader)
+        header = tuple(first_chunk.columns)
+        chunks = (parse_first_column_dates(chunk) for chunk in chain([first_chunk], reader) if len(chunk))
+    else:
+        rows = iter_excel_rows(file)
+        header = next(rows, ())
+        chunks = (pd.DataFrame(chunk, dtype=object) for chunk in get_chunks(rows, chunk_size))
+
+    return header, (chunk.set_axis(range(len(header)), axis=1) for chunk in chunks)
+
+
+def parse_first_column_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Function to convert the text dates (yyyy-mm-dd) of the first column of a DataFrame to timestamps.
+    :param df:
+    :return:
+    """
+    column = df.columns[0]
+    dates = pd.to_datetime(df[column], format="%Y-%m-%d", errors="coerce")
+    df[column] = dates.astype(object).where(dates.notna(), df[column])
+    return df
+
+
+def get_columnar_grid(data: dict, fields: list) -> dict:
+    """
+    Function to convert {date: {category: {field: value}}} data to a dates list, a categories list with their ids
+    and a [date][category] matrix per field, where the missing cells are None. The totals are left out.
+    :param data:
+    :param fields:
+    :return:
+    """
+    dates = [key for key in data if key != "total"]
+    categories = {}
+    category_ids = []
+    for key in dates:
+        for name, cell in data[key].items():
+            if name != "total" and name not in categories:
+                categories[name] = len(categories)
+                category_ids.append(cell.get("category_id"))
+
+    matrices = {field: [[None] * len(categories) for _ in dates] for field in fields}
+    for row, key in enumerate(dates):
+        for name, cell in data[key].items():
+            if name != "total":
+                for field in fields:
+                    matrices[field][row][categories[name]] = cell[field]
+    return {"dates": dates, "categories": list(categories), "category_ids": category_ids, **matrices}
+
+
+def is_columnar_format_requested() -> bool:
+    """
+    Function to check if a request asks for the columnar format, with format=columnar or a MessagePack Accept header.
+    :return:
+    """
+    return request.args.get("format") == "columnar" or is_msgpack_accepted()
+
+
+def is_msgpack_accepted() -> bool:
+    # Only an explicit MessagePack mimetype counts, */* accepts JSON.
+    return any(mimetype in MSGPACK_MIMETYPES for mimetype, _ in request.accept_mimetypes)
+
+
+def make_columnar_response(data: dict, status: int = 200):
+    """
+    Function to make the response of columnar data, in MessagePack when the request accepts it, else in JSON
+    encoded with orjson.
+    :param data:
+    :param status:
+    :return:
+    """
+    if is_msgpack_accepted():
+        return current_app.response_class(
+            msgpack.packb(data, default=str), status=status, mimetype=MSGPACK_MIMETYPES[0]
+        )
+    return current_app.response_class(
+        orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY), status=status, mimetype="application/json"
+    )
+
+
+class ExportSink(io.RawIOBase):
+    """
+    Write only file which keeps the bytes written until they are drained, so that a file can be sent while it
+    is written. Its position keeps counting, as a Parquet writer records the offsets of what it wrote.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_keyset_pages(query, key_columns: list, page_size: int = EXPORT_BATCH_SIZE):
+    """
+    Function to run a query page by page, ordered by key_columns, where each page is a query of at most page_size
+    rows after the key of the last row of the previous page. Unlike a cursor with yield_per, which the MySQL
+    driver buffers in full, only one page is in memory at a time. key_columns must be the first columns of the
+    query, and unique for its rows.
+    :param query:
+    :param key_columns:
+    :param page_size:
+    :return: the lists of rows of the pages.
+    """
+    query = query.order_by(*key_columns).limit(page_size)
+    page_query = query
+    while True:
+        rows = db.session.execute(page_query).all()
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        page_query = query.where(tuple_(*key_columns) > tuple_(*rows[-1][: len(key_columns)]))
+
+
+def iter_record_batches(pages, schema: pa.Schema):
+    """
+    Function to convert pages of rows, with the columns of schema, to record batches.
+    :param pages:
+    :param schema:
+    :return:
+    """
+    for rows in pages:
+        columns = zip(*rows)
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        )
+
+
+def iter_export_file(batches, schema: pa.Schema, export_format: str):
+    """
+    Function to write record batches to an Arrow IPC stream or to a Parquet file, with a row group per batch, and
+    to yield the bytes of the file as each batch is written.
+    :param batches:
+    :param schema:
+    :param export_format: arrow or parquet.
+    :return:
+    """
+    sink = ExportSink()
+    writer = pa.ipc.new_stream(sink, schema) if export_format == "arrow" else pq.ParquetWriter(sink, schema)
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def make_export_response(batches, schema: pa.Schema, export_format: str, name: str):
+    """
+    Function to make a streamed response of an export file.
+    :param batches:
+    :param schema:
+    :param export_format:
+    :param name: file name without extension.
+    :return:
+    """
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return current_app.response_class(
+        stream_with_context(iter_export_file(batches, schema, export_format)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={name}.{extension}"},
+    )
+
+
+def iter_file_and_remove(path: str, chunk_size: int = 1 << 20):
+    """
+    Function to read a file in chunks of chunk_size bytes, and to remove it once it is read or the reading stops.
+    :param path:
+    :param chunk_size:
+    :return:
+    """
+    try:
+        with open(path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def make_file_response(path: str, mimetype: str, filename: str):
+    """
+    Function to make a streamed response of a temporary file, which is removed once it is sent.
+    :param path:
+    :param mimetype:
+    :param filename:
+    :return:
+    """
+    return current_app.response_class(
+        iter_file_and_remove(path),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}", "Content-Length": os.path.getsize(path)},
+    )
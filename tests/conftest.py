@@ -4,6 +4,9 @@ import os
 import pytest
 
 from main import db, get_app
+from main.cache import cache
+from main.modules.warehouse_manpower.controller import PortfolioController
+from main.modules.warehouse_manpower.model import Category
 
 
 @pytest.fixture(scope="class")
@@ -16,9 +19,12 @@ def app():
     app = get_app("test")
     with app.app_context():
         db.create_all()
+        Category.invalidate_mappings()
+        cache.clear()
 
     yield app
 
+    PortfolioController.shutdown_process_pool()
     with app.app_context():
         db.drop_all()
 
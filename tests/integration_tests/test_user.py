@@ -60,3 +60,17 @@ def test_update_users_profile_by_id(client, add_fixtures):
 
     response = client.put("/users/profiles/2", headers=headers, json=get_update_profile_data())
     assert response.status_code == 200
+
+
+def test_update_users_profile_clears_cached_profiles(client, add_fixtures):
+    user_headers = get_headers(client)
+    admin_headers = get_headers(client, role=AuthUserController.ROLES.ADMIN.value)
+    user_id = client.get("/users/profile", headers=user_headers).json["id"]
+    client.get("/users/profiles", headers=admin_headers)
+
+    # An update by the admin clears the profile cached for the user, and the list of profiles.
+    response = client.put(f"/users/profiles/{user_id}", headers=admin_headers, json={"first_name": "Updated"})
+    assert response.status_code == 200
+    assert client.get("/users/profile", headers=user_headers).json["first_name"] == "Updated"
+    profiles = client.get("/users/profiles", headers=admin_headers).json
+    assert next(profile for profile in profiles if profile["id"] == user_id)["first_name"] == "Updated"
@@ -1,9 +1,28 @@
+import io
 import os
+from datetime import date
 
+import msgpack
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
+from sqlalchemy.exc import SQLAlchemyError
 
+from main.jobs import run_next_job
 from main.modules.auth.controller import AuthUserController
-from main.modules.warehouse_manpower.controller import WarehouseController
+from main.modules.warehouse_manpower.controller import (
+    DemandController,
+    ResultController,
+    WarehouseController,
+)
+from main.modules.warehouse_manpower.model import (
+    BenchmarkProductivity,
+    Category,
+    InputDemand,
+    InputRequirements,
+)
 from tests.utils import get_user_role_login_credentials
 
 
@@ -44,9 +63,10 @@ def test_add_and_get_warehouses(client, add_fixtures):
     response = client.get("/wmp/warehouses", headers=headers)
     assert response.status_code == 200
     assert len(response.json) == 4
+    assert set(response.json[0]) == {"id", "name", "description", "created_at", "updated_at"}
 
 
-def test_upload_get_and_update_benchmark_productivity(client, add_fixtures):
+def test_upload_get_and_update_benchmark_productivity(client, add_fixtures, monkeypatch):
     headers = get_headers(client)
     test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("integration_tests", "xls_files")
     # Upload from a file.
@@ -101,6 +121,9 @@ def test_upload_get_and_update_benchmark_productivity(client, add_fixtures):
     assert len(response.json) == 24
     assert response.json[0]["productivity_new_employee"] == 70
     benchmark_productivity_id = response.json[0]["id"]
+    etag = response.headers["ETag"]
+    conditional_response = client.get("/wmp/benchmark_productivity/1", headers={**headers, "If-None-Match": etag})
+    assert conditional_response.status_code == 304
 
     # Update benchmark productivity
 
@@ -110,12 +133,50 @@ def test_upload_get_and_update_benchmark_productivity(client, add_fixtures):
 
     # Check if the value got updated or not
 
-    response = client.get("/wmp/benchmark_productivity/1", headers=headers)
+    response = client.get("/wmp/benchmark_productivity/1", headers={**headers, "If-None-Match": etag})
     assert response.status_code == 200
     assert response.json[0]["productivity_new_employee"] == 80
 
+    # An update which can not be written fails, and nothing is updated.
+    def failing_update_rows(rows):
+        raise SQLAlchemyError("failed")
+
+    monkeypatch.setattr(BenchmarkProductivity, "update_rows", failing_update_rows)
+    data = {"productivity": [{"id": benchmark_productivity_id, "productivity_new_employee": 90}]}
+    response = client.put("/wmp/benchmark_productivity", headers=headers, json=data)
+    assert response.status_code == 400
+    monkeypatch.undo()
+    response = client.get("/wmp/benchmark_productivity/1", headers=headers)
+    assert response.json[0]["productivity_new_employee"] == 80
+
+    # Upload from csv and parquet files.
+    df = pd.read_excel(test_file_dir + "/Productivity.xlsx")
+    df.loc[0, "productivity_new_employee"] = 75
+    files = {"file": (io.BytesIO(df.to_csv(index=False).encode()), "Productivity.csv")}
+    response = client.post("/wmp/upload_productivity_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    response = client.get("/wmp/benchmark_productivity/1", headers=headers)
+    assert response.json[0]["productivity_new_employee"] == 75
+
+    df.loc[0, "productivity_new_employee"] = 7.5
+    files = {"file": (io.BytesIO(df.to_parquet(index=False)), "Productivity.parquet")}
+    response = client.post("/wmp/upload_productivity_file/1", data=files, headers=headers)
+    assert response.status_code == 400
+    assert response.json == {"error": [f"Invalid value(s) for : {df.loc[0, 'category']}"]}
+
+    # Upload as a background import.
+    with open(test_file_dir + "/Invalid_Productivity_Missing_Column.xlsx", "rb") as file:
+        response = client.post("/wmp/upload_productivity_file/1?mode=async", data={"file": file}, headers=headers)
+    assert response.status_code == 202
+    import_id = response.json["import_id"]
+    with client.application.app_context():
+        assert run_next_job() == import_id
+    response = client.get(f"/wmp/imports/{import_id}", headers=headers)
+    assert response.json["status"] == "finished"
+    assert response.json["errors"] == [response.json["result"]["error"]]
+
 
-def test_upload_get_and_test_demands(client, add_fixtures):
+def test_upload_get_and_test_demands(client, add_fixtures, monkeypatch):
     headers = get_headers(client)
     test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("integration_tests", "xls_files")
     # Upload from a file.
@@ -187,20 +248,240 @@ def test_upload_get_and_test_demands(client, add_fixtures):
     assert "total" in response.json
     assert len(response.json.keys()) == 9
     assert response.json["2023-05-24"]["category 1"]["demand"] == 269
+    dates = [key for key in response.json if key != "total"]
+    assert response.json["2023-05-24"]["total"] == sum(
+        cell["demand"] for name, cell in response.json["2023-05-24"].items() if name != "total"
+    )
+    assert response.json["total"]["category 1"] == sum(response.json[date]["category 1"]["demand"] for date in dates)
+    assert response.json["total"]["total"] == sum(response.json[date]["total"] for date in dates)
 
     demand_id = response.json["2023-05-24"]["category 1"]["id"]
 
+    # A client which has the current demands gets a 304 without a body, per query and format.
+    url = "/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31"
+    etag = response.headers["ETag"]
+    conditional_response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert conditional_response.status_code == 304
+    assert conditional_response.data == b""
+    conditional_response = client.get(f"{url}&format=columnar", headers={**headers, "If-None-Match": etag})
+    assert conditional_response.status_code == 200
+
     #  Update Demand
     data = {"demands": [{"id": demand_id, "demand": 900}]}
     response = client.put("/wmp/demands", headers=headers, json=data)
     assert response.status_code == 200
 
-    response = client.get("/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31", headers=headers)
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
     assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json["2023-05-24"]["category 1"]["demand"] == 900
+
+    def failing_update_rows(rows):
+        raise SQLAlchemyError("failed")
+
+    monkeypatch.setattr(InputDemand, "update_rows", failing_update_rows)
+    response = client.put("/wmp/demands", headers=headers, json={"demands": [{"id": demand_id, "demand": 901}]})
+    assert response.status_code == 400
+    assert response.json == {"error": f"Could not update the demands with ids [{demand_id}]"}
+    monkeypatch.undo()
+    response = client.get(url, headers=headers)
     assert response.json["2023-05-24"]["category 1"]["demand"] == 900
 
+    # Uploading the file again updates the existing demands in place.
+    with open(test_file_dir + "/Demand.xlsx", "rb") as file:
+        files = {"file": file, "start_date": "2023-05-24", "end_date": "2023-05-31"}
+        response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+
+    response = client.get("/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31", headers=headers)
+    assert response.json["2023-05-24"]["category 1"]["demand"] == 269
+    assert response.json["2023-05-24"]["category 1"]["id"] == demand_id
+
+    # The same file is not imported again, a changed file only writes its changed demands.
+    written_demands = []
+    upsert_rows = InputDemand.upsert_rows
+    monkeypatch.setattr(
+        InputDemand, "upsert_rows", lambda rows, *args: written_demands.extend(rows) or upsert_rows(rows, *args)
+    )
+    with client.application.app_context():
+        demand_version = WarehouseController.get_warehouse_by_id(1).demand_version
+    with open(test_file_dir + "/Demand.xlsx", "rb") as file:
+        files = {"file": file, "start_date": "2023-05-24", "end_date": "2023-05-31"}
+        response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    assert written_demands == []
+
+    df = pd.read_excel(test_file_dir + "/Demand.xlsx").dropna(how="all")
+    df.loc[0, "category 1"] = 268
+    files = {
+        "file": (io.BytesIO(df.to_csv(index=False, date_format="%Y-%m-%d").encode()), "Demand.csv"),
+        "start_date": "2023-05-24",
+        "end_date": "2023-05-31",
+    }
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    assert [demand["demand"] for demand in written_demands] == [268]
+    with client.application.app_context():
+        assert WarehouseController.get_warehouse_by_id(1).demand_version == demand_version + 1
+
+    # A demand which can not be written fails the upload, which writes nothing.
+    def failing_upsert_rows(rows, *args):
+        raise SQLAlchemyError("failed")
+
+    monkeypatch.setattr(InputDemand, "upsert_rows", failing_upsert_rows)
+    df.loc[0, "category 1"] = 267
+    files = {
+        "file": (io.BytesIO(df.to_csv(index=False, date_format="%Y-%m-%d").encode()), "Demand.csv"),
+        "start_date": "2023-05-24",
+        "end_date": "2023-05-31",
+    }
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 400
+    assert response.json["error"] == ["Demand (267) could not be saved for date : 2023-05-24 category : category 1"]
+    with client.application.app_context():
+        assert WarehouseController.get_warehouse_by_id(1).demand_version == demand_version + 1
+    monkeypatch.undo()
+
+    # Upload from csv and parquet files.
+    df = pd.read_excel(test_file_dir + "/Demand.xlsx").dropna(how="all")
+    df.loc[0, "category 1"] = 270
+    files = {
+        "file": (io.BytesIO(df.to_csv(index=False, date_format="%Y-%m-%d").encode()), "Demand.csv"),
+        "start_date": "2023-05-24",
+        "end_date": "2023-05-31",
+    }
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    response = client.get("/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31", headers=headers)
+    assert response.json["2023-05-24"]["category 1"]["demand"] == 270
+
+    # The same demands in the columnar format.
+    demands = response.json
+    response = client.get("/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31&format=columnar", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json["dates"]) == 8
+    assert response.json["demand"] == [
+        [demands[date].get(category, {}).get("demand") for category in response.json["categories"]]
+        for date in response.json["dates"]
+    ]
+    assert (
+        response.json["category_ids"][0]
+        == demands[response.json["dates"][0]][response.json["categories"][0]]["category_id"]
+    )
+
+    df["date"] = df["date"].dt.date
+    df.loc[0, "category 1"] = 271
+    files = {
+        "file": (io.BytesIO(df.to_parquet(index=False)), "Demand.parquet"),
+        "start_date": "2023-05-24",
+        "end_date": "2023-05-31",
+    }
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    response = client.get("/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31", headers=headers)
+    assert response.json["2023-05-24"]["category 1"]["demand"] == 271
+
+    df.loc[1, "category 1"] = None
+    files = {
+        "file": (io.BytesIO(df.to_parquet(index=False)), "Demand.parquet"),
+        "start_date": "2023-05-24",
+        "end_date": "2023-05-31",
+    }
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 400
+    assert response.json == {"error": ["Invalid Demand (None) for date : 2023-05-25 category : category 1"]}
+
+    # Upload as a background import.
+    df.loc[1, "category 1"] = 272
+    files = {
+        "file": (io.BytesIO(df.to_parquet(index=False)), "Demand.parquet"),
+        "start_date": "2023-05-24",
+        "end_date": "2023-05-31",
+    }
+    response = client.post("/wmp/demand_forecast_file/1?mode=async", data=files, headers=headers)
+    assert response.status_code == 202
+    import_id = response.json["import_id"]
+
+    response = client.get(f"/wmp/imports/{import_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.json["status"] == "queued"
+    assert response.json["rows_processed"] == 0
+
+    with client.application.app_context():
+        assert run_next_job() == import_id
+
+    response = client.get(f"/wmp/imports/{import_id}", headers=headers)
+    assert response.json["status"] == "finished"
+    assert response.json["rows_processed"] == 8
+    assert response.json["errors"] == []
+    assert response.json["result"] == {"status": "success"}
+    response = client.get("/wmp/demands/1?start_date=2023-05-24&end_date=2023-05-31", headers=headers)
+    assert response.json["2023-05-25"]["category 1"]["demand"] == 272
+
+    with open(test_file_dir + "/Invalid_Demand_Value.xlsx", "rb") as file:
+        files = {"file": file, "start_date": "2023-05-24", "end_date": "2023-05-31"}
+        response = client.post("/wmp/demand_forecast_file/1?mode=async", data=files, headers=headers)
+    import_id = response.json["import_id"]
+    with client.application.app_context():
+        run_next_job()
+    response = client.get(f"/wmp/imports/{import_id}", headers=headers)
+    assert response.json["num_errors"] == 1
+    assert response.json["errors"] == ["Invalid Demand (276sd) for date : 2023-05-31 category : category 1"]
+    assert response.json["result"] == {"error": response.json["errors"]}
+
+    response = client.get("/wmp/imports/invalid_import_id", headers=headers)
+    assert response.status_code == 404
+
+    # The rows which cannot be written are reported, the others are still written.
+    with client.application.app_context():
+        demands, error_data = DemandController.add_demands(
+            [
+                {"warehouse_id": 1, "category_id": 1, "date": date(2023, 5, 24), "demand": 300},
+                {"warehouse_id": 1, "category_id": None, "date": date(2023, 5, 24), "demand": 300},
+                {"warehouse_id": 1, "category_id": 1, "date": date(2023, 6, 1), "demand": 300},
+            ],
+            chunk_size=2,
+        )
+    assert [demand["id"] for demand in demands][0] == demand_id
+    assert len(demands) == 2 and all(demand["id"] for demand in demands)
+    assert len(error_data) == 1 and "error" in error_data[0]
+
+
+def test_upload_large_demand_csv(client, add_fixtures):
+    headers = get_headers(client)
+    test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("integration_tests", "xls_files")
+
+    with open(test_file_dir + "/Productivity.xlsx", "rb") as file:
+        response = client.post("/wmp/upload_productivity_file/1", data={"file": file}, headers=headers)
+    assert response.status_code == 201
+
+    # A file which is bigger than the read buffer of the csv reader.
+    categories = pd.read_excel(test_file_dir + "/Demand.xlsx").columns[1:]
+    dates = pd.date_range("2030-01-01", periods=3000)
+    df = pd.DataFrame({"date": dates, **{category: range(1, 3001) for category in categories}})
+    content = df.to_csv(index=False, date_format="%Y-%m-%d").encode()
+    assert len(content) > 1 << 16
+    files = {
+        "file": (io.BytesIO(content), "Demand.csv"),
+        "start_date": "2030-01-01",
+        "end_date": str(dates[-1].date()),
+    }
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    response = client.get(f"/wmp/demands/1?start_date={dates[-1].date()}&end_date={dates[-1].date()}", headers=headers)
+    assert response.json[str(dates[-1].date())][categories[0]]["demand"] == 3000
+
+    # The same file is skipped once it is imported.
+    with client.application.app_context():
+        demand_version = WarehouseController.get_warehouse_by_id(1).demand_version
+    files["file"] = (io.BytesIO(content), "Demand.csv")
+    response = client.post("/wmp/demand_forecast_file/1", data=files, headers=headers)
+    assert response.status_code == 201
+    with client.application.app_context():
+        assert WarehouseController.get_warehouse_by_id(1).demand_version == demand_version
+
 
-def test_calculate_result(client, add_fixtures, monkeypatch):
+def test_calculate_result(client, add_fixtures, monkeypatch, mocker):
     headers = get_headers(client)
     test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("integration_tests", "xls_files")
 
@@ -231,3 +512,252 @@ def test_calculate_result(client, add_fixtures, monkeypatch):
     }
     response = client.post("/wmp/calculate", headers=headers, json=input_requirements)
     assert response.status_code == 200
+    assert len(response.json["output"]) == 8
+    cell = response.json["output"]["2023-05-24"]["category 1"]
+    assert cell["total"] == cell["num_of_existing_to_deploy"] + cell["num_of_new_to_deploy"]
+    assert cell["total"] > 0
+    fulfillment = response.json["demand_vs_fulfillment_data"]["2023-05-24"]["total"]
+    assert fulfillment["fulfillment_p10"] <= fulfillment["fulfillment_p50"] <= fulfillment["fulfillment_p90"]
+    assert fulfillment["fulfillment_p90"] <= fulfillment["expected_demand"]
+    additional_data = response.json["additional_data"]
+    assert additional_data["total_hiring_budget"] == 200000 - additional_data["hiring_cost"]
+    assert 0 <= additional_data["project_fulfillment"] <= 100
+    requirement_id = response.json["requirement_id"]
+
+    # The same requirement on the same data returns the stored result.
+    response = client.post("/wmp/calculate", headers=headers, json=input_requirements)
+    assert response.status_code == 200
+    assert response.json["requirement_id"] == requirement_id
+
+    # The same result in the columnar format, as MessagePack.
+    columnar_response = client.post(
+        "/wmp/calculate", headers={**headers, "Accept": "application/msgpack"}, json=input_requirements
+    )
+    assert columnar_response.status_code == 200
+    assert columnar_response.mimetype == "application/msgpack"
+    result = msgpack.unpackb(columnar_response.data)
+    assert result["requirement_id"] == requirement_id
+    output = result["output"]
+    assert len(output["dates"]) == 8
+    row, column = output["dates"].index("2023-05-24"), output["categories"].index("category 1")
+    assert output["total"][row][column] == cell["total"]
+    assert result["demand_vs_fulfillment_data"]["fulfillment_p50"][row][column] >= 0
+
+    # Export the demands, the benchmark productivity and the plan.
+    export_response = client.get("/wmp/export/demands/1?start_date=2023-05-24&end_date=2023-05-31", headers=headers)
+    assert export_response.status_code == 200
+    assert export_response.mimetype == "application/vnd.apache.arrow.stream"
+    demands = pa.ipc.open_stream(export_response.data).read_all()
+    expected_demand = result["input_data"]["expected_demand"]["demand"]
+    assert demands.num_rows == sum(
+        demand is not None for demands_of_date in expected_demand for demand in demands_of_date
+    )
+    assert demands.column_names == ["date", "category_id", "category", "demand"]
+    assert demands.column("date")[0].as_py() == date(2023, 5, 24)
+
+    export_response = client.get("/wmp/export/benchmark_productivity/1?format=parquet", headers=headers)
+    assert export_response.status_code == 200
+    productivity = pq.read_table(io.BytesIO(export_response.data))
+    assert productivity.num_rows == 24
+
+    export_response = client.get(f"/wmp/export/results/{requirement_id}?format=parquet", headers=headers)
+    assert export_response.status_code == 200
+    plan = pq.read_table(io.BytesIO(export_response.data)).to_pandas()
+    plan_cell = plan[(plan["date"] == date(2023, 5, 24)) & (plan["category"] == "category 1")].iloc[0]
+    assert plan_cell["num_of_existing_to_deploy"] + plan_cell["num_of_new_to_deploy"] == cell["total"]
+    assert plan_cell["fulfillment_p10"] <= plan_cell["fulfillment_p90"] <= plan_cell["expected_demand"]
+
+    export_response = client.get(f"/wmp/export/plans?requirement_id={requirement_id}", headers=headers)
+    assert export_response.status_code == 200
+    workbook = openpyxl.load_workbook(io.BytesIO(export_response.data), read_only=True)
+    assert workbook.sheetnames == ["Plan", "Demand vs fulfillment"]
+    rows = list(workbook["Plan"].values)
+    assert rows[0][:5] == ("warehouse", "requirement_id", "date", "category", "num_of_existing_to_deploy")
+    assert len(rows) == len(plan) + 1
+    plan_row = next(row for row in rows[1:] if row[2].date() == date(2023, 5, 24) and row[3] == "category 1")
+    assert plan_row[:2] == ("Warehouse A", requirement_id) and plan_row[-1] == cell["total"]
+    assert len(list(workbook["Demand vs fulfillment"].values)) == len(plan) + 1
+
+    # The plan is loaded once for both sheets, which are each continued on new sheets once they are full.
+    export_result = mocker.spy(ResultController, "export_result")
+    monkeypatch.setattr(ResultController, "EXCEL_MAX_ROWS", (len(plan) + 1) // 2 + 1)
+    export_response = client.get(f"/wmp/export/plans?requirement_id={requirement_id}", headers=headers)
+    assert export_response.status_code == 200
+    assert export_result.call_count == 1
+    workbook = openpyxl.load_workbook(io.BytesIO(export_response.data), read_only=True)
+    assert sorted(workbook.sheetnames) == ["Demand vs fulfillment", "Demand vs fulfillment (2)", "Plan", "Plan (2)"]
+    for sheet_name in ["Plan", "Demand vs fulfillment"]:
+        rows = [*workbook[sheet_name].values, *list(workbook[f"{sheet_name} (2)"].values)[1:]]
+        assert len(rows) == len(plan) + 1 and rows[0][:4] == ("warehouse", "requirement_id", "date", "category")
+
+    export_response = client.get("/wmp/export/results/100", headers=headers)
+    assert export_response.status_code == 404
+    export_response = client.get(
+        f"/wmp/export/plans?requirement_id={requirement_id}&requirement_id=100", headers=headers
+    )
+    assert export_response.status_code == 404
+    export_response = client.get("/wmp/export/plans", headers=headers)
+    assert export_response.status_code == 400
+    export_response = client.get("/wmp/export/demands/1?format=csv", headers=headers)
+    assert export_response.status_code == 400
+
+    # A demand update invalidates the stored result.
+    demand_id = response.json["input_data"]["expected_demand"]["2023-05-24"]["category 1"]["id"]
+    response = client.put("/wmp/demands", headers=headers, json={"demands": [{"id": demand_id, "demand": 300}]})
+    assert response.status_code == 200
+    response = client.post("/wmp/calculate", headers=headers, json=input_requirements)
+    assert response.status_code == 200
+    assert response.json["requirement_id"] != requirement_id
+
+    # A change of the categories invalidates the stored result too.
+    requirement_id = response.json["requirement_id"]
+    with client.application.app_context():
+        Category.invalidate_mappings()
+    response = client.post("/wmp/calculate", headers=headers, json=input_requirements)
+    assert response.status_code == 200
+    assert response.json["requirement_id"] != requirement_id
+
+    response = client.post("/wmp/calculate", headers=headers, json={**input_requirements, "warehouse_id": 100})
+    assert response.status_code == 404
+
+    # Reversed plan dates, an absence above 100% or fewer than 0 employees are rejected before a requirement is
+    # stored.
+    with client.application.app_context():
+        num_requirements = InputRequirements.query.count()
+    for invalid_data in [
+        {"plan_from_date": "2023-06-01"},
+        {"percentage_absent_expected": 150},
+        {"num_current_employees": -1},
+    ]:
+        response = client.post("/wmp/calculate", headers=headers, json={**input_requirements, **invalid_data})
+        assert response.status_code == 400
+    with client.application.app_context():
+        assert InputRequirements.query.count() == num_requirements
+
+    # Update demands of a calculated requirement, only the affected cells are solved again.
+    response = client.post("/wmp/calculate", headers=headers, json=input_requirements)
+    requirement_id = response.json["requirement_id"]
+    data = {"demands": [{"id": demand_id, "demand": 5000}]}
+    response = client.put(f"/wmp/requirements/{requirement_id}/demands", headers=headers, json=data)
+    assert response.status_code == 200
+    assert response.json["requirement_id"] == requirement_id
+    assert response.json["input_data"]["expected_demand"]["2023-05-24"]["category 1"]["demand"] == 5000
+    assert response.json["demand_vs_fulfillment_data"]["2023-05-24"]["category 1"]["expected_demand"] == 5000
+    assert response.json["demand_vs_fulfillment_data"]["2023-05-24"]["category 1"]["fulfillment_p90"] <= 5000
+    recalculated = response.json
+
+    # The patched result is the one a new calculation on the same data returns.
+    response = client.post("/wmp/calculate", headers=headers, json=input_requirements)
+    assert response.json == recalculated
+
+    response = client.put("/wmp/requirements/1000/demands", headers=headers, json=data)
+    assert response.status_code == 404
+
+    # Calculate as a background job.
+    response = client.post("/wmp/calculate?mode=async", headers=headers, json=input_requirements)
+    assert response.status_code == 202
+    job_id = response.json["job_id"]
+
+    response = client.get(f"/wmp/calculate/{job_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.json["status"] == "queued"
+
+    with client.application.app_context():
+        assert run_next_job() == job_id
+
+    response = client.get(f"/wmp/calculate/{job_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.json["status"] == "finished"
+    assert len(response.json["result"]["output"]) == 8
+
+    response = client.get("/wmp/calculate/invalid_job_id", headers=headers)
+    assert response.status_code == 404
+
+
+def test_compare_scenarios(client, add_fixtures):
+    headers = get_headers(client)
+    scenarios = {
+        "warehouse_id": 1,
+        "num_current_employees": 10,
+        "plan_from_date": "2023-05-24",
+        "plan_to_date": "2023-05-31",
+        "cost_per_employee_per_month": 10000,
+        "percentage_absent_expected": [0, 5, 10],
+        "day_working_hours": [8, 10],
+        "total_hiring_budget": [20000, 200000],
+    }
+    response = client.post("/wmp/scenarios", headers=headers, json=scenarios)
+    assert response.status_code == 200
+    assert response.json["columns"][:3] == ["percentage_absent_expected", "day_working_hours", "total_hiring_budget"]
+    assert len(response.json["rows"]) == 12
+    assert response.json["rows"][0][:3] == [0, 8, 20000]
+
+    response = client.post(
+        "/wmp/scenarios", headers=headers, json={**scenarios, "total_hiring_budget": list(range(500))}
+    )
+    assert response.status_code == 400
+
+    response = client.post("/wmp/scenarios", headers=headers, json={**scenarios, "warehouse_id": 100})
+    assert response.status_code == 404
+
+    response = client.post("/wmp/scenarios", headers=headers, json={**scenarios, "plan_from_date": "2023-06-01"})
+    assert response.status_code == 400
+
+
+def test_plan_portfolio(client, add_fixtures):
+    headers = get_headers(client)
+    test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("integration_tests", "xls_files")
+
+    for warehouse_id in [1, 2]:
+        with open(test_file_dir + "/Productivity.xlsx", "rb") as file:
+            response = client.post(
+                f"/wmp/upload_productivity_file/{warehouse_id}", data={"file": file}, headers=headers
+            )
+        assert response.status_code == 201
+
+        df = pd.read_excel(test_file_dir + "/Demand.xlsx").dropna(how="all")
+        df.iloc[:, 1:] *= warehouse_id
+        files = {
+            "file": (io.BytesIO(df.to_csv(index=False, date_format="%Y-%m-%d").encode()), "Demand.csv"),
+            "start_date": "2023-05-24",
+            "end_date": "2023-05-31",
+        }
+        response = client.post(f"/wmp/demand_forecast_file/{warehouse_id}", data=files, headers=headers)
+        assert response.status_code == 201
+
+    portfolio = {
+        "num_current_employees_per_warehouse": 10,
+        "plan_from_date": "2023-05-24",
+        "plan_to_date": "2023-05-31",
+        "percentage_absent_expected": 5,
+        "day_working_hours": 8,
+        "cost_per_employee_per_month": 10000,
+        "hiring_budget_per_warehouse": 200000,
+    }
+    # The warehouses are solved inline with one worker, and across the process pool with two.
+    client.application.config["PORTFOLIO_MAX_WORKERS"] = 1
+    response = client.post("/wmp/portfolio", headers=headers, json=portfolio)
+    assert response.status_code == 200
+    client.application.config["PORTFOLIO_MAX_WORKERS"] = 2
+    pool_response = client.post("/wmp/portfolio", headers=headers, json=portfolio)
+    assert pool_response.status_code == 200
+    assert pool_response.json == response.json
+
+    warehouses = response.json["warehouses"]
+    assert [warehouse["warehouse_id"] for warehouse in warehouses] == [1, 2]
+    assert warehouses[1]["expected_demand"] == 2 * warehouses[0]["expected_demand"] > 0
+    total = response.json["total"]
+    for key in ["expected_demand", "num_of_existing_to_deploy", "num_of_new_to_deploy"]:
+        assert total[key] == sum(warehouse[key] for warehouse in warehouses)
+
+    response = client.post("/wmp/portfolio", headers=headers, json={**portfolio, "warehouse_ids": [1]})
+    assert response.status_code == 200
+    assert [warehouse["warehouse_id"] for warehouse in response.json["warehouses"]] == [1]
+
+    response = client.post("/wmp/portfolio", headers=headers, json={**portfolio, "warehouse_ids": [1, 100]})
+    assert response.status_code == 404
+
+    response = client.post("/wmp/portfolio", headers=headers, json={**portfolio, "plan_from_date": "2023-06-01"})
+    assert response.status_code == 400
+    response = client.post("/wmp/portfolio", headers=headers, json={**portfolio, "percentage_absent_expected": 101})
+    assert response.status_code == 400
@@ -0,0 +1,38 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+from main.modules.warehouse_manpower.controller import DemandController
+
+
+def test_check_and_convert_excel_data_according_to_input_demand():
+    header = ("date", "category 1", "category 2")
+    rows = [
+        (datetime(2023, 5, 24), 10, "12"),
+        (datetime(2023, 5, 25), 2.5, 0),
+        (datetime(2023, 5, 24), 1, 1),
+        (datetime(2023, 6, 1), 1, 1),
+        ("24-05-2023", 1, 1),
+        (datetime(2023, 5, 26), 3.0, None),
+        (date(2023, 5, 27), float("nan"), 4),
+    ]
+    missing_dates = {date(2023, 5, 24), date(2023, 5, 25), date(2023, 5, 26), date(2023, 5, 27)}
+    demands, error_data = DemandController.check_and_convert_excel_data_according_to_input_demand(
+        pd.DataFrame(rows, dtype=object), header, missing_dates, {"category 1": 1, "category 2": 2}, 1
+    )
+    assert demands == [
+        {"warehouse_id": 1, "category_id": 1, "date": date(2023, 5, 24), "demand": 10},
+        {"warehouse_id": 1, "category_id": 2, "date": date(2023, 5, 24), "demand": 12},
+        {"warehouse_id": 1, "category_id": 1, "date": date(2023, 5, 26), "demand": 3},
+        {"warehouse_id": 1, "category_id": 2, "date": date(2023, 5, 27), "demand": 4},
+    ]
+    assert error_data == [
+        "Invalid Demand (2.5) for date : 2023-05-25 category : category 1",
+        "Demand (0) should be greater then 0 for date : 2023-05-25 category : category 2",
+        "Invalid Date : 2023-05-24",
+        "Invalid Date : 2023-06-01",
+        "Invalid format for date : 24-05-2023",
+        "Invalid Demand (None) for date : 2023-05-26 category : category 2",
+        "Invalid Demand (None) for date : 2023-05-27 category : category 1",
+    ]
+    assert missing_dates == set()
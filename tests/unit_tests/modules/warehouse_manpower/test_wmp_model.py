@@ -0,0 +1,93 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import mysql
+
+from main.db import db
+from main.modules.warehouse_manpower.model import (
+    BenchmarkProductivity,
+    Category,
+    Warehouse,
+)
+
+
+class TestBatchMethods:
+    def test_create_many(self, app):
+        with app.app_context():
+            categories, error_data = Category.create_many(
+                [{"name": "category 1"}, {"name": "category 2", "description": "second"}], ["name"], chunk_size=1
+            )
+            assert [category["id"] for category in categories] == [
+                Category.query.filter_by(name=name).first().id for name in ["category 1", "category 2"]
+            ]
+            assert error_data == []
+
+            categories, error_data = Category.create_many(
+                [{"name": "category 3"}, {"name": "category 1"}, {"name": "category 4"}], ["name"]
+            )
+            assert [category["name"] for category in categories] == ["category 3", "category 4"]
+            assert all(category["id"] for category in categories)
+            assert [category["name"] for category in error_data] == ["category 1"]
+            assert "error" in error_data[0]
+            assert Category.query.count() == 4
+
+    def test_update_many(self, app):
+        with app.app_context():
+            category = Category.query.filter_by(name="category 1").first()
+            assert category.updated_at is None
+            categories, error_data = Category.update_many(
+                [{"id": category.id, "description": "first"}, {"id": category.id + 1, "name": "category 3"}]
+            )
+            assert len(categories) == 1 and len(error_data) == 1
+
+            category = Category.query.filter_by(name="category 1").first()
+            assert category.description == "first"
+            assert category.updated_at is not None
+
+    def test_upsert_many(self, app):
+        with app.app_context():
+            warehouses, _ = Warehouse.create_many([{"name": "warehouse 1"}], key_columns=["name"])
+            category_id = Category.query.filter_by(name="category 1").first().id
+            productivity = {
+                "warehouse_id": warehouses[0]["id"],
+                "category_id": category_id,
+                "productivity_experienced_employee": 10,
+                "productivity_new_employee": 5,
+            }
+            created, _ = BenchmarkProductivity.upsert_many(
+                [productivity], ["warehouse_id", "category_id"], ["productivity_new_employee"]
+            )
+            updated, _ = BenchmarkProductivity.upsert_many(
+                [{**productivity, "productivity_new_employee": 8}],
+                ["warehouse_id", "category_id"],
+                ["productivity_new_employee"],
+            )
+            assert created[0]["id"] == updated[0]["id"]
+            assert BenchmarkProductivity.query.count() == 1
+            assert BenchmarkProductivity.query.first().productivity_new_employee == 8
+
+    def test_mysql_upsert_statement(self):
+        statement = BenchmarkProductivity.get_upsert_statement(
+            "mysql", ["warehouse_id", "category_id"], ["productivity_new_employee"]
+        )
+        sql = str(statement.compile(dialect=mysql.dialect()))
+        assert "ON DUPLICATE KEY UPDATE" in sql
+        assert "productivity_new_employee = VALUES(productivity_new_employee)" in sql
+        assert "updated_at = now()" in sql
+
+
+class TestCategoryMappings:
+    def test_mappings_are_cached_until_invalidated(self, app):
+        with app.app_context():
+            category = Category.create({"name": "category 1"})
+            assert Category.category_name_to_id_mapping() == {"category 1": category.id}
+
+            # A write which bypasses the model is not seen until the mappings are invalidated.
+            db.session.execute(insert(Category.__table__), [{"name": "category 2"}])
+            db.session.commit()
+            assert Category.category_id_to_name_mapping() == {category.id: "category 1"}
+            Category.invalidate_mappings()
+            assert set(Category.category_name_to_id_mapping()) == {"category 1", "category 2"}
+
+            category.update({"name": "category 3"})
+            assert set(Category.category_name_to_id_mapping()) == {"category 2", "category 3"}
+            Category.create_many([{"name": "category 4"}], ["name"])
+            assert len(Category.category_id_to_name_mapping()) == 3
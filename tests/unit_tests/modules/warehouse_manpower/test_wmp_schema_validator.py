@@ -0,0 +1,85 @@
+import pytest
+from marshmallow import ValidationError
+
+from main.modules.warehouse_manpower.schema_validator import (
+    PortfolioValidator,
+    RequirementValidator,
+    ScenarioValidator,
+)
+
+
+class TestWmpSchemaValidators:
+    @pytest.mark.parametrize(
+        "schema, data",
+        [
+            (
+                RequirementValidator,
+                {
+                    "warehouse_id": 1,
+                    "num_current_employees": 10,
+                    "percentage_absent_expected": 5,
+                    "day_working_hours": 8,
+                    "total_hiring_budget": 200000,
+                },
+            ),
+            (
+                ScenarioValidator,
+                {
+                    "warehouse_id": 1,
+                    "num_current_employees": 10,
+                    "percentage_absent_expected": [5],
+                    "day_working_hours": [8],
+                    "total_hiring_budget": [200000],
+                },
+            ),
+            (
+                PortfolioValidator,
+                {
+                    "num_current_employees_per_warehouse": 10,
+                    "percentage_absent_expected": 5,
+                    "day_working_hours": 8,
+                    "hiring_budget_per_warehouse": 200000,
+                },
+            ),
+        ],
+    )
+    def test_plan_dates(self, schema, data):
+        data = {**data, "cost_per_employee_per_month": 10000}
+        schema().load({**data, "plan_from_date": "2099-05-24", "plan_to_date": "2099-05-24"})
+
+        with pytest.raises(ValidationError) as error:
+            schema().load({**data, "plan_from_date": "2099-05-31", "plan_to_date": "2099-05-24"})
+        assert error.value.messages == {"plan_to_date": ["plan_from_date should not be after plan_to_date."]}
+
+    def test_portfolio_percentage_absent_expected(self):
+        data = {
+            "num_current_employees_per_warehouse": 10,
+            "plan_from_date": "2099-05-24",
+            "plan_to_date": "2099-05-31",
+            "day_working_hours": 8,
+            "cost_per_employee_per_month": 10000,
+            "hiring_budget_per_warehouse": 200000,
+        }
+        result = PortfolioValidator().load({**data, "percentage_absent_expected": 100})
+        assert (result["num_current_employees"], result["total_hiring_budget"]) == (10, 200000)
+
+        with pytest.raises(ValidationError) as error:
+            PortfolioValidator().load({**data, "percentage_absent_expected": 101})
+        assert list(error.value.messages) == ["percentage_absent_expected"]
+
+    def test_requirement_ranges(self):
+        data = {
+            "warehouse_id": 1,
+            "num_current_employees": 0,
+            "plan_from_date": "2099-05-24",
+            "plan_to_date": "2099-05-31",
+            "percentage_absent_expected": 0,
+            "day_working_hours": 8,
+            "cost_per_employee_per_month": 10000,
+            "total_hiring_budget": 200000,
+        }
+        RequirementValidator().load({**data, "percentage_absent_expected": 100})
+
+        with pytest.raises(ValidationError) as error:
+            RequirementValidator().load({**data, "percentage_absent_expected": 150, "num_current_employees": -1})
+        assert sorted(error.value.messages) == ["num_current_employees", "percentage_absent_expected"]
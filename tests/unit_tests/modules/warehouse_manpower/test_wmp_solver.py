@@ -0,0 +1,155 @@
+from datetime import date
+
+import numpy as np
+
+from main.modules.warehouse_manpower.solver import (
+    allocate_new_employees,
+    build_plan_grid,
+    dump_state,
+    get_fulfillment_bands,
+    load_state,
+    simulate_attendance,
+    solve_dates,
+    solve_headcount,
+    solve_scenarios,
+)
+
+
+def get_grid():
+    demand_rows = [
+        (date(2023, 5, 24), 2, 100),
+        (date(2023, 5, 24), 1, 160),
+        (date(2023, 5, 26), 1, 80),
+    ]
+    productivity_rows = [(1, 10, 5), (2, 5, 5), (3, 1, 1)]
+    return build_plan_grid(date(2023, 5, 24), date(2023, 5, 26), demand_rows, productivity_rows)
+
+
+def test_build_plan_grid():
+    grid = get_grid()
+    assert grid.category_ids.tolist() == [1, 2]
+    assert grid.dates == [date(2023, 5, 24), date(2023, 5, 25), date(2023, 5, 26)]
+    assert grid.demand.tolist() == [[160, 100], [0, 0], [80, 0]]
+    assert grid.mask.tolist() == [[True, True], [False, False], [True, False]]
+    assert grid.productivity_experienced.tolist() == [10, 5]
+    assert grid.productivity_new.tolist() == [5, 5]
+
+    empty_grid = build_plan_grid(date(2023, 5, 24), date(2023, 5, 25), [], [])
+    assert empty_grid.demand.shape == (2, 0)
+
+
+def test_solve_headcount():
+    grid = get_grid()
+    solution = solve_headcount(grid.demand, grid.productivity_experienced, grid.productivity_new, 5, 0, 8)
+    # Day 1 needs 2 + 3 existing employees, which are all available.
+    assert solution["existing"].tolist() == [[2, 3], [0, 0], [1, 0]]
+    assert solution["new"].tolist() == [[0, 0], [0, 0], [0, 0]]
+    assert np.array_equal(solution["fulfillment_with_total"], grid.demand)
+
+    solution = solve_headcount(grid.demand, grid.productivity_experienced, grid.productivity_new, 5, 20, 8)
+    # Only 4 existing employees are present, so day 1 gets floor(2 * 0.8) and floor(3 * 0.8) of them.
+    assert solution["existing"].tolist() == [[1, 2], [0, 0], [1, 0]]
+    assert solution["fulfillment_with_current"].tolist() == [[80, 80], [0, 0], [80, 0]]
+    # The 80 and 20 units left are covered by new employees who each deliver 5 * 8 * 0.8 units a day.
+    assert solution["new"].tolist() == [[3, 1], [0, 0], [0, 0]]
+    assert np.array_equal(solution["fulfillment_with_total"], grid.demand)
+
+
+def test_solve_headcount_broadcasts_scenarios():
+    grid = get_grid()
+    absent = np.array([0, 20]).reshape(2, 1, 1)
+    solution = solve_headcount(grid.demand, grid.productivity_experienced, grid.productivity_new, 5, absent, 8)
+    assert solution["existing"].shape == (2, 3, 2)
+    assert solution["existing"][1].tolist() == [[1, 2], [0, 0], [1, 0]]
+
+
+def test_allocate_new_employees():
+    residual = np.array([[25.0, 10.0], [0.0, 4.0]])
+    capacity = np.array([10.0, 5.0])
+    # Full hires gain 10, 10, 5, 5 and the partial hires gain 5 and 4.
+    assert allocate_new_employees(residual, capacity, 3).tolist() == [[2, 1], [0, 0]]
+    assert allocate_new_employees(residual, capacity, 5).tolist() == [[3, 2], [0, 0]]
+    assert allocate_new_employees(residual, capacity, 100).tolist() == [[3, 2], [0, 1]]
+    limits = np.array([0, 3]).reshape(2, 1, 1)
+    assert allocate_new_employees(residual, capacity, limits).sum(axis=(1, 2)).tolist() == [0, 3]
+
+
+def test_solve_headcount_within_budget():
+    grid = get_grid()
+    solution = solve_headcount(grid.demand, grid.productivity_experienced, grid.productivity_new, 5, 20, 8, 6000, 60000)
+    # A new employee costs 2000 a day, so only 3 of the 4 needed can be deployed.
+    assert solution["new"].sum() == 3
+    assert solution["hiring_cost"] == 6000
+    assert solution["fulfillment_with_total"].sum() < grid.demand.sum()
+
+
+def test_solve_dates_matches_full_solve():
+    grid = get_grid()
+    parameters = (grid.productivity_experienced, grid.productivity_new, 5, 20, 8)
+    for budget, cost in ((None, None), (4000, 60000)):
+        solution = solve_headcount(grid.demand, *parameters, budget, cost)
+        grid.demand[2, 1] = 70
+        patched = solve_dates(grid, solution, np.array([2]), 5, 20, 8, budget, cost)
+        expected = solve_headcount(grid.demand, *parameters, budget, cost)
+        for key in expected:
+            assert np.array_equal(patched[key], expected[key])
+        grid.demand[2, 1] = 0
+
+
+def test_dump_and_load_state():
+    grid = get_grid()
+    solution = solve_headcount(grid.demand, grid.productivity_experienced, grid.productivity_new, 5, 20, 8)
+    loaded_grid, loaded_solution = load_state(dump_state(grid, solution))
+    assert loaded_grid.start_date == grid.start_date
+    assert np.array_equal(loaded_grid.demand, grid.demand)
+    assert np.array_equal(loaded_grid.mask, grid.mask)
+    assert loaded_solution.keys() == solution.keys()
+    assert np.array_equal(loaded_solution["new"], solution["new"])
+
+
+def test_solve_scenarios():
+    grid = get_grid()
+    absent, budget = np.array([0, 20, 20]), np.array([60000, 60000, 6000])
+    totals = solve_scenarios(grid, 5, absent, 8, budget, 60000, max_cells=12)
+    for i in range(3):
+        solution = solve_headcount(
+            grid.demand, grid.productivity_experienced, grid.productivity_new, 5, absent[i], 8, budget[i], 60000
+        )
+        assert totals["existing"][i] == solution["existing"].sum()
+        assert totals["new"][i] == solution["new"].sum()
+        assert totals["hiring_cost"][i] == solution["hiring_cost"]
+        assert totals["fulfillment_with_total"][i] == solution["fulfillment_with_total"].sum()
+
+
+def test_simulate_attendance():
+    attendance = simulate_attendance(3, 20, num_draws=1000, seed=1)
+    assert attendance.shape == (3, 3)
+    assert np.all(attendance[0] <= attendance[1]) and np.all(attendance[1] <= attendance[2])
+    assert np.allclose(attendance[1], 0.8, atol=0.02)
+    assert np.array_equal(attendance, simulate_attendance(3, 20, num_draws=1000, seed=1))
+    assert np.array_equal(simulate_attendance(2, 0), np.ones((3, 2)))
+
+
+def test_get_fulfillment_bands():
+    grid = get_grid()
+    parameters = (grid.productivity_experienced, grid.productivity_new, 5, 20, 8)
+    solution = solve_headcount(grid.demand, *parameters)
+    # At the expected attendance every band is the planned fulfillment.
+    bands = get_fulfillment_bands(
+        grid.demand, solution, grid.productivity_experienced, grid.productivity_new, np.full((1, 3), 0.8), 20, 8
+    )
+    assert np.allclose(bands[0], solution["fulfillment_with_total"])
+
+    bands = get_fulfillment_bands(
+        grid.demand,
+        solution,
+        grid.productivity_experienced,
+        grid.productivity_new,
+        np.array([[0.4] * 3, [0.8] * 3]),
+        20,
+        8,
+    )
+    assert bands.shape == (2, 3, 2)
+    assert np.all(bands[0] <= bands[1])
+    # Half of the planned employees are present: existing 4 * 80 / 2 + new 0 on the first cell.
+    assert bands[0, 0, 0] == min(160, (solution["existing"][0, 0] * 80 + solution["new"][0, 0] * 40 * 0.8) / 2)
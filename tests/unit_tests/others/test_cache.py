@@ -0,0 +1,158 @@
+import threading
+import time
+
+from main.cache import (
+    INVALIDATION_CHANNEL,
+    LocalCache,
+    cache,
+    cache_key,
+    clear_cache,
+    get_cached_response,
+    get_tag_version_key,
+    get_tag_versions,
+    publish_invalidation,
+    redis_client,
+)
+from main.modules.warehouse_manpower.controller import (
+    DemandController,
+    WarehouseController,
+)
+
+
+def test_cache_key(app):
+    with app.test_request_context("/wmp/demands/1?end_date=2023-05-31&start_date=2023-05-24"):
+        assert cache_key(["wmp:warehouse:0:demands"]) == (
+            "wmp:warehouse:0:demands@0|/wmp/demands/1?end_date=2023-05-31&start_date=2023-05-24"
+        )
+    with app.test_request_context("/wmp/demands/1", headers={"Accept": "application/msgpack"}):
+        assert cache_key(["wmp:warehouse:0:demands"]) == "wmp:warehouse:0:demands@0|/wmp/demands/1?accept=msgpack&"
+
+
+def test_clear_cache(app):
+    with app.test_request_context("/wmp/demands/1"):
+        tags = ["wmp:warehouse:1:demands", "wmp:warehouse:10:demands"]
+        key = cache_key(tags)
+        clear_cache(tags[0], "wmp:warehouses")
+        assert cache_key(tags) != key
+        clear_cache(tags[0])
+        assert cache_key(tags[1:]) == key[key.index(",") + 1 :]
+
+        # By default the tag is the request path.
+        key = cache_key(["/wmp/demands/1"])
+        clear_cache()
+        assert cache_key(["/wmp/demands/1"]) != key
+
+
+def test_demands_are_cached_per_warehouse(app, mocker):
+    get_demands = mocker.patch.object(DemandController, "get_demands_by_warehouse_id", return_value={})
+    get_warehouses = mocker.patch.object(WarehouseController, "get_warehouses", return_value=[])
+    client = app.test_client()
+    query = "?start_date=2023-05-24&end_date=2023-05-31"
+    for warehouse_id in [1, 2, 1, 2]:
+        assert client.get(f"/wmp/demands/{warehouse_id}{query}").status_code == 200
+    assert get_demands.call_count == 2
+    assert client.get("/wmp/warehouses").status_code == 200
+
+    # A demand change of warehouse 1 only clears the cached demands of warehouse 1.
+    with app.app_context():
+        WarehouseController.increment_data_version({1}, "demand_version")
+    for warehouse_id in [1, 2]:
+        client.get(f"/wmp/demands/{warehouse_id}{query}")
+    assert get_demands.call_args_list[-1].args[0] == 1
+    assert get_demands.call_count == 3
+    client.get("/wmp/warehouses")
+    assert get_warehouses.call_count == 1
+
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_local_cache(mocker):
+    monotonic = mocker.patch("main.cache.time.monotonic", return_value=0)
+    local_cache = LocalCache(max_size=2, timeout=10)
+    local_cache.set("a", 1)
+    local_cache.set("b", 2, timeout=60)
+    assert local_cache.get("a") == 1
+    # The least recently used item is evicted.
+    local_cache.set("c", 3, timeout=5)
+    assert local_cache.get("b") is None
+    assert (local_cache.get("a"), local_cache.get("c")) == (1, 3)
+
+    monotonic.return_value = 5
+    assert (local_cache.get("a"), local_cache.get("c")) == (1, None)
+    monotonic.return_value = 10
+    assert local_cache.get("a") is None
+
+
+def test_two_tier_cache(app):
+    with app.app_context():
+        cache.set("two_tier", {"value": 1})
+        # A value is read from the local cache once it is read or written, and every read gets its own copy.
+        cache.cache._write_client.delete("flask_cache_two_tier")
+        value = cache.get("two_tier")
+        assert value == {"value": 1} and value is not cache.get("two_tier")
+
+        # A delete by another worker is published to all the workers.
+        publish_invalidation(["flask_cache_two_tier"])
+        assert wait_until(lambda: cache.get("two_tier") is None)
+
+
+def test_tag_versions_are_invalidated_across_workers(app):
+    tag = "wmp:warehouse:3:demands"
+    (version,) = get_tag_versions([tag])
+    # Another worker increments the version and publishes it.
+    redis_client.incr(get_tag_version_key(tag))
+    assert get_tag_versions([tag]) == [version]
+    redis_client.publish(INVALIDATION_CHANNEL, f'["{get_tag_version_key(tag)}"]')
+    assert wait_until(lambda: get_tag_versions([tag]) == [str(int(version) + 1)])
+
+
+class TestGetCachedResponse:
+    def test_fresh_and_stale_responses(self, app, mocker):
+        compute = mocker.Mock(side_effect=["first", "second"])
+        with app.app_context():
+            assert get_cached_response("stampede_stale", compute) == "first"
+            assert get_cached_response("stampede_stale", compute) == "first"
+            assert compute.call_count == 1
+            entry = cache.get("stampede_stale")
+            assert 59 < entry["fresh_until"] - time.time() <= 66
+
+            # A stale response is served while another worker holds the lock, else it is recomputed.
+            cache.set("stampede_stale", {**entry, "fresh_until": time.time() - 1})
+            lock = redis_client.lock("cache_lock:stampede_stale", timeout=10)
+            lock.acquire()
+            assert get_cached_response("stampede_stale", compute) == "first"
+            lock.release()
+            assert get_cached_response("stampede_stale", compute) == "second"
+            assert compute.call_count == 2
+
+    def test_wait_for_the_worker_with_the_lock(self, app, mocker):
+        compute = mocker.Mock(return_value="computed")
+        with app.app_context():
+            lock = redis_client.lock("cache_lock:stampede_missing", timeout=10, thread_local=False)
+            lock.acquire()
+
+            def compute_in_other_worker():
+                time.sleep(0.2)
+                with app.app_context():
+                    cache.set("stampede_missing", {"response": "other", "fresh_until": time.time() + 60})
+                lock.release()
+
+            thread = threading.Thread(target=compute_in_other_worker)
+            thread.start()
+            assert get_cached_response("stampede_missing", compute) == "other"
+            thread.join()
+            compute.assert_not_called()
+
+            # When the worker with the lock fails, the response is computed.
+            lock = redis_client.lock("cache_lock:stampede_failed", timeout=10, thread_local=False)
+            lock.acquire()
+            threading.Timer(0.2, lock.release).start()
+            assert get_cached_response("stampede_failed", compute) == "computed"
+            assert compute.call_count == 1
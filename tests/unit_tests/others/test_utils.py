@@ -1,17 +1,30 @@
+import io
+import os
+from datetime import date, datetime
+
+import pandas as pd
 import pytest
 from marshmallow import ValidationError
 from pytest import raises
+from werkzeug.datastructures import FileStorage
 
 from main.db import db
 from main.modules.auth.controller import AuthUserController
 from main.modules.auth.model import AuthUser
+from main.modules.warehouse_manpower.model import Category
 from main.utils import (
     CustomValidationError,
     FiltersDataSchema,
     access_logger,
+    get_chunks,
+    get_columnar_grid,
     get_data_from_request_or_raise_validation_error,
+    get_date,
     get_query_including_filters,
+    iter_excel_rows,
+    iter_keyset_pages,
     log_user_access,
+    read_file_in_chunks,
 )
 
 
@@ -94,3 +107,76 @@ def test_log_user_access(app, mocker):
             "Status code: 200"
         )
         assert result == mock_response
+
+
+def test_iter_excel_rows():
+    test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("unit_tests/others", "xls_files")
+    with open(test_file_dir + "/Demand.xlsx", "rb") as file:
+        rows = list(iter_excel_rows(FileStorage(file, filename="Demand.xlsx")))
+    assert rows[0][:2] == ("date", "category 1")
+    # The empty rows after the data are skipped.
+    assert len(rows) == 9
+    assert rows[1][:2] == (datetime(2023, 5, 24), 269)
+
+
+@pytest.mark.parametrize("extension", [".xlsx", ".csv", ".parquet"])
+def test_read_file_in_chunks(extension):
+    test_file_dir = os.path.abspath(os.path.dirname(__file__)).replace("unit_tests/others", "xls_files")
+    df = pd.read_excel(test_file_dir + "/Demand.xlsx").dropna(how="all")
+    if extension == ".xlsx":
+        file = open(test_file_dir + "/Demand.xlsx", "rb")
+    elif extension == ".csv":
+        file = io.BytesIO(df.to_csv(index=False, date_format="%Y-%m-%d").encode())
+    else:
+        file = io.BytesIO(df.to_parquet(index=False))
+    with file:
+        header, chunks = read_file_in_chunks(FileStorage(file, filename="Demand" + extension), 3)
+        chunks = list(chunks)
+    assert header == tuple(df.columns)
+    assert [len(chunk) for chunk in chunks] == [3, 3, 2]
+    assert list(chunks[0].columns) == list(range(len(header)))
+    assert get_date(chunks[0].iat[0, 0]) == date(2023, 5, 24)
+    assert chunks[0].iat[0, 1] == 269
+
+
+def test_read_file_in_chunks_with_empty_csv():
+    header, chunks = read_file_in_chunks(FileStorage(io.BytesIO(b""), filename="Demand.csv"), 3)
+    assert header == () and list(chunks) == []
+
+
+def test_get_chunks():
+    assert list(get_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(get_chunks([], 2)) == []
+
+
+def test_get_columnar_grid():
+    data = {
+        "2023-05-24": {"a": {"demand": 1, "category_id": 1}, "total": 1},
+        "2023-05-25": {"b": {"demand": 3, "category_id": 2}, "a": {"demand": 2, "category_id": 1}, "total": 5},
+        "total": {"a": 3, "b": 3, "total": 6},
+    }
+    assert get_columnar_grid(data, ["demand"]) == {
+        "dates": ["2023-05-24", "2023-05-25"],
+        "categories": ["a", "b"],
+        "category_ids": [1, 2],
+        "demand": [[1, None], [2, 3]],
+    }
+
+
+def test_iter_keyset_pages(app):
+    with app.app_context():
+        Category.create_many([{"name": f"category {i}", "description": str(i % 2)} for i in range(5)], ["name"])
+        query = db.select(Category.name).filter(Category.name.like("category %"))
+        pages = list(iter_keyset_pages(query, [Category.name], page_size=2))
+        assert [[row.name for row in rows] for rows in pages] == [
+            ["category 0", "category 1"],
+            ["category 2", "category 3"],
+            ["category 4"],
+        ]
+
+        query = db.select(Category.description, Category.name).filter(Category.name != "category 4")
+        pages = list(iter_keyset_pages(query, [Category.description, Category.name], page_size=2))
+        assert [[row.name for row in rows] for rows in pages] == [
+            ["category 0", "category 2"],
+            ["category 1", "category 3"],
+        ]